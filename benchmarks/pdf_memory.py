@@ -0,0 +1,66 @@
+"""Measures the peak memory of rendering long text PDFs with utils.pdf_util.PdfTextWriter.
+
+Each document is rendered in a fresh process, so its peak RSS is not hidden
+by an earlier, larger run:
+
+    python benchmarks/pdf_memory.py 10 1000 3000
+
+Rendering to a file keeps peak RSS flat in the number of pages. Rendering to
+io.BytesIO, as the print functions do, adds the compressed PDF itself.
+"""
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "functions"))
+
+# 50 lines of text fill one letter page
+LINES_PER_PAGE = 50
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def lines(pages: int):
+    for i in range(pages * LINES_PER_PAGE):
+        yield " ".join(WORDS[(i + j) % len(WORDS)] for j in range(14)) + f" {i}"
+
+
+def render(pages: int, target: str) -> None:
+    from utils.pdf_util import PdfTextWriter
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if target == "file":
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "benchmark.pdf")
+            with PdfTextWriter(path) as writer:
+                writer.write_lines(lines(pages))
+            size = os.path.getsize(path)
+    else:
+        buffer = io.BytesIO()
+        with PdfTextWriter(buffer) as writer:
+            writer.write_lines(lines(pages))
+        size = len(buffer.getbuffer())
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(
+        f"{pages:6d} pages  to {target:7s}  peak RSS {peak / 1024:6.1f} MB (+{(peak - baseline) / 1024:5.1f})"
+        f"  {elapsed:6.2f}s  {size // 1024:6d} KB"
+    )
+
+
+def main(args: list[str]) -> None:
+    if args and args[0] == "--render":
+        render(int(args[1]), args[2])
+        return
+    for pages in [int(arg) for arg in args] or [10, 1000, 3000]:
+        for target in ("file", "BytesIO"):
+            subprocess.run([sys.executable, __file__, "--render", str(pages), target], check=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
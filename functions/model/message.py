@@ -0,0 +1,12 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class MessageRecord:
+    """The parts of a Slack message that the reports use."""
+
+    channel_id: str
+    ts: str
+    user: str | None
+    text: str
+    subtype: str | None = None
@@ -25,7 +25,7 @@ def process_and_print_file(file_name_to_search, response_url):
         one_year_ago_timestamp = int((datetime.now() - timedelta(weeks=52)).timestamp())
 
         # Use the helper function to find files
-        found_files = slack_helper.get_file_from_channels(file_name_to_search, one_year_ago_timestamp)
+        found_files, suggested_file_names = slack_helper.search_files(file_name_to_search, one_year_ago_timestamp)
         
         # Initialize EpsonConnect client
         ec = epson_connect.Client(
@@ -68,6 +68,12 @@ def process_and_print_file(file_name_to_search, response_url):
             else:
                 response_message = f"Failed to download file from URL: {file_url}"
 
+        elif suggested_file_names:
+            response_message = (
+                "No files found with the specified name. Did you mean: "
+                + ", ".join(f"`{name}`" for name in suggested_file_names)
+                + "?"
+            )
         else:
             response_message = "No files found with the specified name."
 
@@ -1,15 +1,18 @@
+import io
+import itertools
 import json
+import re
 from datetime import datetime, timedelta
-from slack_sdk import WebClient
 from firebase_functions import https_fn
 import os
 from dotenv import load_dotenv
-from utils import gpt_utils, slack_helper
+from utils import gpt_utils, report_rollup, slack_helper
+from utils.slack_scheduler import RateLimitedWebClient
 import threading
 import requests
-import tempfile
 import epson_connect
-from utils.pdf_util import create_pdf_with_text
+from utils.epson_connect import layout_print_settings, print_pdf_bytes
+from utils.pdf_util import create_pdf_with_text, get_layout
 
 load_dotenv()
 
@@ -17,13 +20,13 @@ printer_email = os.getenv("PRINTER_EMAIL")
 client_id = os.getenv("EPSON_CLIENT_ID")
 client_secret = os.getenv("EPSON_CLIENT_SECRET")
 slack_token = os.getenv("SLACK_BOT_TOKEN")
-client = WebClient(token=slack_token)
+client = RateLimitedWebClient(token=slack_token)
 
 
-def generate_and_send_monthly_report(response_url):
+def generate_and_send_monthly_report(response_url, layout):
     # Define the timestamp for one month ago
     one_month_ago_timestamp = int((datetime.now() - timedelta(weeks=4)).timestamp())
-    all_messages_text = slack_helper.fetch_messages_for_period(one_month_ago_timestamp)
+    messages = slack_helper.fetch_message_window_for_period(one_month_ago_timestamp)
 
     # Define the month range for the title
     month_start = (datetime.now() - timedelta(weeks=4)).strftime('%Y-%m-%d')
@@ -31,12 +34,14 @@ def generate_and_send_monthly_report(response_url):
     title = f"Monthly Report ({month_start} to {month_end})"
 
     # Generate the monthly report
-    report_content = gpt_utils.gpt_generate_monthly_report(all_messages_text) if all_messages_text else "No messages to summarize for the past month."
-    report = f"{title}\n\n{report_content}"
-    
-    # Create a PDF with the report text
-    pdf_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-    create_pdf_with_text(report, pdf_path)
+    # Compose cached weekly summaries, so only new or changed weeks are summarized
+    weekly_summaries = report_rollup.summarize_weeks(messages, one_month_ago_timestamp) if len(messages) else []
+    report_content = gpt_utils.gpt_generate_monthly_report_from_summaries(weekly_summaries) if weekly_summaries else ["No messages to summarize for the past month."]
+
+    # Render the report PDF in memory, laying it out as the model writes it
+    pdf_buffer = io.BytesIO()
+    create_pdf_with_text(itertools.chain([f"{title}\n\n"], report_content), pdf_buffer, layout)
+    print(f"OpenAI latency: {gpt_utils.router.stats()}")
 
     try:
         # Initialize EpsonConnect client
@@ -47,13 +52,10 @@ def generate_and_send_monthly_report(response_url):
         )
 
         # Print the report
-        print_response = ec.printer.print(pdf_path)
+        print_response = print_pdf_bytes(ec.printer, pdf_buffer.getbuffer(), layout_print_settings(layout))
         response_message = f"Monthly report has been sent to the printer. Print Job ID: {print_response}"
     except Exception as e:
         response_message = f"Error printing report: {str(e)}"
-    finally:
-        # Delete the temporary PDF after printing
-        os.remove(pdf_path)
 
     # Send only the print status (without report content) to Slack asynchronously
     requests.post(response_url, json={"text": response_message})
@@ -64,19 +66,25 @@ def print_monthly_report(req: https_fn.Request) -> https_fn.Response:
     try:
         data = req.form
         response_url = data.get("response_url")
+
+        # Optional compact print layout, e.g. "layout:2up"
+        layout_match = re.search(r'layout:(\S+)', data.get("text", ""))
+        layout = get_layout(layout_match.group(1) if layout_match else "1up")
     except (TypeError, AttributeError):
         return https_fn.Response(
             json.dumps({"error": "Invalid payload"}),
             status=400,
             content_type="application/json"
         )
+    except ValueError as e:
+        return https_fn.Response(json.dumps({"error": str(e)}), status=400, content_type="application/json")
 
     # Immediate response to avoid timeout
     immediate_response = {"text": "Generating your monthly report..."}
     https_response = https_fn.Response(json.dumps(immediate_response), status=200, content_type="application/json")
 
     # Run report generation asynchronously
-    threading.Thread(target=generate_and_send_monthly_report, args=(response_url,)).start()
+    threading.Thread(target=generate_and_send_monthly_report, args=(response_url, layout)).start()
 
     return https_response
 
@@ -1,18 +1,22 @@
+import io
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from firebase_functions import https_fn
-from utils import slack_helper
+from utils import gpt_utils, slack_helper
 from utils.file_processor import FileProcessor
 from model.language import Language
-from utils.gpt_utils import translate
+from utils.configs import TRANSLATION_CACHE_MAX_BYTES
+from utils.translation_cache import TranslationCache
+from utils.translation_memory import iter_translate_with_memory
 import threading
 import requests
 import re
 import os
 import epson_connect
 from dotenv import load_dotenv
-import tempfile
-from utils.pdf_util import create_pdf_with_text
+from utils.epson_connect import layout_print_settings, print_pdf_bytes
+from utils.pdf_util import PdfTextWriter, get_layout, script_font, script_font_warning
 
 # Load environment variables
 load_dotenv()
@@ -23,15 +27,63 @@ client_id = os.getenv("EPSON_CLIENT_ID")
 client_secret = os.getenv("EPSON_CLIENT_SECRET")
 slack_token = os.getenv("SLACK_BOT_TOKEN")
 
-
-def process_and_translate_file(file_name_to_search, language_param, response_url):
+# Survives between invocations served by the same function instance
+translation_cache = TranslationCache(TRANSLATION_CACHE_MAX_BYTES)
+
+# Script each language is written in, which decides the font of its PDF; other languages are Latin
+LANGUAGE_SCRIPTS = {
+    Language.HINDI: "devanagari",
+    Language.JAPANESE: "japanese",
+    Language.RUSSIAN: "cyrillic",
+}
+
+
+def translate_and_print(extracted_text, language, file_name, layout):
+    """Translates extracted text into one language, renders it as a PDF and prints it. Returns the print job ID."""
+    # Reuse an earlier translation of the same text, otherwise translate and render it
+    cache_key = translation_cache.key(extracted_text, language, gpt_utils.router.cache_tag, gpt_utils.TRANSLATE_PROMPT_VERSION) if extracted_text else None
+    cached = translation_cache.get(cache_key) if cache_key else None
+    if cached and cached.layout == layout.name:
+        print(f"Translation cache hit for {file_name} ({language.value})")
+        pdf_bytes = cached.pdf_bytes
+    else:
+        if cached:
+            # Only the layout differs; every section is in the translation memory, so no LLM call is made
+            print(f"Translation cache hit for {file_name} ({language.value}), laying it out as {layout.name}")
+        fragments = iter_translate_with_memory(extracted_text, language) if extracted_text else ["No text extracted."]
+
+        # Lay out the translation into the PDF as it arrives, section by section
+        pdf_buffer = io.BytesIO()
+        font_name = script_font(LANGUAGE_SCRIPTS.get(language, "latin"))
+        with PdfTextWriter(pdf_buffer, font_name=font_name, layout=layout) as writer:
+            for fragment in fragments:
+                writer.write(fragment)
+        pdf_bytes = pdf_buffer.getvalue()
+        if cache_key:
+            translation_cache.put(cache_key, pdf_bytes, layout.name)
+
+    # Initialize EpsonConnect client
+    ec = epson_connect.Client(
+        printer_email=printer_email,
+        client_id=client_id,
+        client_secret=client_secret,
+    )
+
+    # Print the newly created PDF with translated text
+    return print_pdf_bytes(ec.printer, pdf_bytes, layout_print_settings(layout))
+
+
+def process_and_translate_file(file_name_to_search, language_param, layout_param, response_url):
     try:
-        # Convert language_param to Language enum
-        language = Language(language_param)
+        # Convert the comma-separated language_param to Language enums, keeping the order and dropping repeats
+        languages = list(dict.fromkeys(Language(value.strip()) for value in language_param.split(",") if value.strip()))
+        if not languages:
+            raise ValueError("No language specified.")
+        layout = get_layout(layout_param)
         one_year_ago_timestamp = int((datetime.now() - timedelta(weeks=52)).timestamp())
 
         # Find files with the specified name from the past year
-        found_files = slack_helper.get_file_from_channels(file_name_to_search, one_year_ago_timestamp)
+        found_files, suggested_file_names = slack_helper.search_files(file_name_to_search, one_year_ago_timestamp)
 
         if found_files:
             first_file = found_files[0]
@@ -41,53 +93,42 @@ def process_and_translate_file(file_name_to_search, language_param, response_url
             headers = {"Authorization": f"Bearer {slack_token}"}
 
             # Download the file content
-            response = requests.get(file_url, headers=headers, stream=True)
+            response = requests.get(file_url, headers=headers)
             if response.status_code == 200:
-                # Save the file temporarily
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            temp_file.write(chunk)
-                    temp_file_path = temp_file.name
-
-                # Process and extract text from the file
+                # Process and extract text from the downloaded bytes
                 processor = FileProcessor()
-                with open(temp_file_path, "rb") as file:
-                    file_content = file.read()
+                file_content = response.content
                 content_type = response.headers.get("Content-Type", "")
                 if content_type == "binary/octet-stream" and first_file["file_name"].endswith(".pdf"):
                     content_type = "application/pdf"
                 extracted_text = processor._process_attachment_by_type(content_type, file_content)
 
-                # Translate the extracted text if any
-                translated_text = translate(extracted_text, language) if extracted_text else "No text extracted."
-
-                # Create a new PDF with the translated text
-                translated_pdf_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-                create_pdf_with_text(translated_text, translated_pdf_path)
-
-                # Initialize EpsonConnect client
-                ec = epson_connect.Client(
-                    printer_email=printer_email,
-                    client_id=client_id,
-                    client_secret=client_secret,
-                )
-
-                # Print the newly created PDF with translated text
-                print_response = ec.printer.print(translated_pdf_path)
-                response_message = (
-                    f"Original File URL: {file_url}\n"
-                    f"Language: {language_param.capitalize()}\n"
-                    f"Print Job ID: {print_response}\n"
-                )
-
-                
-                # Delete the temporary files after printing
-                os.remove(temp_file_path)
-                os.remove(translated_pdf_path)
+                # Translate into every language concurrently, with one print job per language
+                with ThreadPoolExecutor(max_workers=len(languages)) as executor:
+                    futures = [
+                        executor.submit(translate_and_print, extracted_text, language, first_file["file_name"], layout)
+                        for language in languages
+                    ]
+
+                print(f"OpenAI latency: {gpt_utils.router.stats()}")
+                response_message = f"Original File URL: {file_url}\n"
+                for language, future in zip(languages, futures):
+                    try:
+                        response_message += f"Language: {language.value.capitalize()} - Print Job ID: {future.result()}"
+                        # Tell the user when the installed fonts cannot print the language as written
+                        warning = script_font_warning(LANGUAGE_SCRIPTS.get(language, "latin"))
+                        response_message += f" (note: {warning})\n" if warning else "\n"
+                    except Exception as e:
+                        response_message += f"Language: {language.value.capitalize()} - Error: {str(e)}\n"
 
             else:
                 response_message = f"Failed to download file from URL: {file_url}"
+        elif suggested_file_names:
+            response_message = (
+                "No files found with the specified name. Did you mean: "
+                + ", ".join(f"`{name}`" for name in suggested_file_names)
+                + "?"
+            )
         else:
             response_message = "No files found with the specified name."
 
@@ -110,8 +151,10 @@ def print_translate(req: https_fn.Request) -> https_fn.Response:
         # Use regular expressions to extract file_name and language from text
         file_name_match = re.search(r'file_name:(\S+)', text)
         language_match = re.search(r'language:(\S+)', text)
+        layout_match = re.search(r'layout:(\S+)', text)
         file_name_to_search = file_name_match.group(1) if file_name_match else ""
         language_param = language_match.group(1).lower() if language_match else ""
+        layout_param = layout_match.group(1).lower() if layout_match else "1up"
 
     except (TypeError, AttributeError):
         return https_fn.Response(
@@ -125,6 +168,6 @@ def print_translate(req: https_fn.Request) -> https_fn.Response:
     https_response = https_fn.Response(json.dumps(immediate_response), status=200, content_type="application/json")
 
     # Run file processing, translation, and printing asynchronously
-    threading.Thread(target=process_and_translate_file, args=(file_name_to_search, language_param, response_url)).start()
+    threading.Thread(target=process_and_translate_file, args=(file_name_to_search, language_param, layout_param, response_url)).start()
 
     return https_response
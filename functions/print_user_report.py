@@ -1,15 +1,20 @@
+import io
+import itertools
 import json
+import re
 from datetime import datetime, timedelta
-from slack_sdk import WebClient
 from firebase_functions import https_fn
 import os
 from dotenv import load_dotenv
 from utils import gpt_utils, slack_helper
+from utils.configs import REPORT_WEEK_TOKEN_BUDGET
+from utils.message_compaction import compact_window
+from utils.slack_scheduler import RateLimitedWebClient
 import threading
 import requests
-import tempfile
 import epson_connect
-from utils.pdf_util import create_pdf_with_text
+from utils.epson_connect import layout_print_settings, print_pdf_bytes
+from utils.pdf_util import create_pdf_with_text, get_layout
 
 load_dotenv()
 
@@ -17,36 +22,51 @@ printer_email = os.getenv("PRINTER_EMAIL")
 client_id = os.getenv("EPSON_CLIENT_ID")
 client_secret = os.getenv("EPSON_CLIENT_SECRET")
 slack_token = os.getenv("SLACK_BOT_TOKEN")
-client = WebClient(token=slack_token)
-
-def generate_and_send_user_report(username, response_url):
-    user_id = slack_helper.get_user_id_by_name(username)
-    if not user_id:
-        requests.post(response_url, json={"text": f"User '{username}' not found"})
+client = RateLimitedWebClient(token=slack_token)
+
+def generate_and_send_user_reports(usernames, response_url, layout):
+    user_ids = {}
+    for username in usernames:
+        user_id = slack_helper.get_user_id_by_name(username)
+        if not user_id:
+            requests.post(response_url, json={"text": f"User '{username}' not found"})
+            continue
+        user_ids[username] = user_id
+
+    if not user_ids:
         return
 
+    # Fetch the messages of every requested user in a single pass over the channels
     one_week_ago_timestamp = int((datetime.now() - timedelta(weeks=1)).timestamp())
-    user_messages = slack_helper.fetch_user_messages_for_period(user_id, one_week_ago_timestamp)
-
-    if not user_messages:
+    messages_by_user = slack_helper.fetch_messages_by_user_for_period(
+        list(set(user_ids.values())), one_week_ago_timestamp
+    )
+
+    for username, user_id in user_ids.items():
+        generate_and_send_user_report(username, messages_by_user[user_id], response_url, layout)
+    print(f"OpenAI latency: {gpt_utils.router.stats()}")
+
+def generate_and_send_user_report(username, user_messages, response_url, layout):
+    # Drop noise and duplicates, and keep the most informative messages if the week is too long
+    user_messages, _ = compact_window(user_messages, REPORT_WEEK_TOKEN_BUDGET)
+    message_texts = slack_helper.message_texts_by_channel(user_messages)
+    if not message_texts:
         requests.post(response_url, json={"text": f"No messages found for user '{username}' in the past week."})
         return
 
-    try:
-        summary_report = gpt_utils.gpt_generate_weekly_report(user_messages)
-    except Exception as e:
-        requests.post(response_url, json={"text": f"Failed to generate report: {str(e)}"})
-        return
-
     # Define the week range for the title
     week_start = (datetime.now() - timedelta(weeks=1)).strftime('%Y-%m-%d')
     week_end = datetime.now().strftime('%Y-%m-%d')
     title = f"Weekly Report for {username} ({week_start} to {week_end})"
-    report = f"{title}\n\n{summary_report}"
 
-    # Create a PDF with the report text
-    pdf_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-    create_pdf_with_text(report, pdf_path)
+    # Render the report PDF in memory, laying it out as the model writes it
+    pdf_buffer = io.BytesIO()
+    try:
+        summary_report = gpt_utils.gpt_generate_weekly_report(message_texts)
+        create_pdf_with_text(itertools.chain([f"{title}\n\n"], summary_report), pdf_buffer, layout)
+    except Exception as e:
+        requests.post(response_url, json={"text": f"Failed to generate report: {str(e)}"})
+        return
 
     try:
         # Initialize EpsonConnect client
@@ -57,13 +77,10 @@ def generate_and_send_user_report(username, response_url):
         )
 
         # Print the report
-        print_response = ec.printer.print(pdf_path)
+        print_response = print_pdf_bytes(ec.printer, pdf_buffer.getbuffer(), layout_print_settings(layout))
         response_message = f"Weekly report for {username} has been sent to the printer. Print Job ID: {print_response}"
     except Exception as e:
         response_message = f"Error printing report for {username}: {str(e)}"
-    finally:
-        # Delete the temporary PDF after printing
-        os.remove(pdf_path)
 
     # Send only the print status to Slack asynchronously
     requests.post(response_url, json={"text": response_message})
@@ -73,16 +90,26 @@ def print_user_report(req: https_fn.Request) -> https_fn.Response:
     # Parse URL-encoded form data
     try:
         data = req.form
-        username = data.get("text", "").strip()  # Slack sends the command input as 'text'
+        text = data.get("text", "").strip()  # Slack sends the command input as 'text'
         response_url = data.get("response_url")  # URL for delayed response
+
+        # Optional compact print layout, e.g. "layout:2up"
+        layout_match = re.search(r'layout:(\S+)', text)
+        layout = get_layout(layout_match.group(1) if layout_match else "1up")
+        text = re.sub(r'layout:\S+', "", text)
+
+        # Several users can be requested at once, separated by commas
+        usernames = [name.strip() for name in text.split(",") if name.strip()]
     except (TypeError, AttributeError):
         return https_fn.Response(
             json.dumps({"error": "Invalid payload"}),
             status=400,
             content_type="application/json"
         )
+    except ValueError as e:
+        return https_fn.Response(json.dumps({"error": str(e)}), status=400, content_type="application/json")
 
-    if not username:
+    if not usernames:
         return https_fn.Response(
             json.dumps({"error": "Username is required"}),
             status=400,
@@ -93,6 +120,6 @@ def print_user_report(req: https_fn.Request) -> https_fn.Response:
     https_response = https_fn.Response(json.dumps({"text": "Generating your weekly report..."}), status=200, content_type="application/json")
 
     # Run report generation asynchronously
-    threading.Thread(target=generate_and_send_user_report, args=(username, response_url)).start()
+    threading.Thread(target=generate_and_send_user_reports, args=(usernames, response_url, layout)).start()
 
     return https_response
@@ -1,15 +1,20 @@
+import io
+import itertools
 import json
+import re
 from datetime import datetime, timedelta
-from slack_sdk import WebClient
 from firebase_functions import https_fn
 import os
 from dotenv import load_dotenv
 from utils import gpt_utils, slack_helper
+from utils.configs import REPORT_WEEK_TOKEN_BUDGET
+from utils.message_compaction import compact_window
+from utils.slack_scheduler import RateLimitedWebClient
 import threading
 import requests
-import tempfile
 import epson_connect
-from utils.pdf_util import create_pdf_with_text
+from utils.epson_connect import layout_print_settings, print_pdf_bytes
+from utils.pdf_util import create_pdf_with_text, get_layout
 
 load_dotenv()
 
@@ -17,30 +22,43 @@ printer_email = os.getenv("PRINTER_EMAIL")
 client_id = os.getenv("EPSON_CLIENT_ID")
 client_secret = os.getenv("EPSON_CLIENT_SECRET")
 slack_token = os.getenv("SLACK_BOT_TOKEN")
-client = WebClient(token=slack_token)
+client = RateLimitedWebClient(token=slack_token)
 
 
-def generate_and_send_report(response_url):
+def _without_title(fragments, title):
+    """Yields the report fragments, dropping the title if the model repeated it at the start."""
+    head = ""
+    fragments = iter(fragments)
+    for fragment in fragments:
+        head += fragment
+        if len(head) >= len(title) or not title.startswith(head):
+            break
+    if head.startswith(title):
+        head = head[len(title):].lstrip()
+    if head:
+        yield head
+    yield from fragments
+
+
+def generate_and_send_report(response_url, layout):
     # Define the timestamp for one week ago
     one_week_ago_timestamp = int((datetime.now() - timedelta(weeks=1)).timestamp())
-    all_messages_text = slack_helper.fetch_messages_for_period(one_week_ago_timestamp)
+    messages = slack_helper.fetch_message_window_for_period(one_week_ago_timestamp)
+
+    # Drop noise and duplicates, and keep the most informative messages if the week is too long
+    messages, _ = compact_window(messages, REPORT_WEEK_TOKEN_BUDGET)
+    message_texts = slack_helper.message_texts_by_channel(messages)
 
     # Define the week range for the title
     week_start = (datetime.now() - timedelta(weeks=1)).strftime('%Y-%m-%d')
     week_end = datetime.now().strftime('%Y-%m-%d')
     title = f"Weekly Report ({week_start} to {week_end})"
 
-    # Generate the weekly report
-    report_content = gpt_utils.gpt_generate_weekly_report(all_messages_text) if all_messages_text else "No messages to summarize for the past week."
-    
-    if report_content.startswith(title):
-        report_content = report_content[len(title):].lstrip()
-        
-    report = f"{title}\n\n{report_content}"
-    
-    # Create a PDF with the report text
-    pdf_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-    create_pdf_with_text(report, pdf_path)
+    # Generate the weekly report, laying it out into the PDF as the model writes it
+    report_content = gpt_utils.gpt_generate_weekly_report(message_texts) if message_texts else ["No messages to summarize for the past week."]
+    pdf_buffer = io.BytesIO()
+    create_pdf_with_text(itertools.chain([f"{title}\n\n"], _without_title(report_content, title)), pdf_buffer, layout)
+    print(f"OpenAI latency: {gpt_utils.router.stats()}")
 
     try:
         # Initialize EpsonConnect client
@@ -51,13 +69,10 @@ def generate_and_send_report(response_url):
         )
 
         # Print the report
-        print_response = ec.printer.print(pdf_path)
+        print_response = print_pdf_bytes(ec.printer, pdf_buffer.getbuffer(), layout_print_settings(layout))
         response_message = f"Weekly report has been sent to the printer. Print Job ID: {print_response}"
     except Exception as e:
         response_message = f"Error printing report: {str(e)}"
-    finally:
-        # Delete the temporary PDF after printing
-        os.remove(pdf_path)
 
     # Send only the print status (without report content) to Slack asynchronously
     requests.post(response_url, json={"text": response_message})
@@ -69,18 +84,24 @@ def print_weekly_report(req: https_fn.Request) -> https_fn.Response:
     try:
         data = req.form
         response_url = data.get("response_url")
+
+        # Optional compact print layout, e.g. "layout:2up"
+        layout_match = re.search(r'layout:(\S+)', data.get("text", ""))
+        layout = get_layout(layout_match.group(1) if layout_match else "1up")
     except (TypeError, AttributeError):
         return https_fn.Response(
             json.dumps({"error": "Invalid payload"}),
             status=400,
             content_type="application/json"
         )
+    except ValueError as e:
+        return https_fn.Response(json.dumps({"error": str(e)}), status=400, content_type="application/json")
 
     # Immediate response to avoid timeout
     immediate_response = {"text": "Generating your weekly report..."}
     https_response = https_fn.Response(json.dumps(immediate_response), status=200, content_type="application/json")
 
     # Run report generation asynchronously
-    threading.Thread(target=generate_and_send_report, args=(response_url,)).start()
+    threading.Thread(target=generate_and_send_report, args=(response_url, layout)).start()
 
     return https_response
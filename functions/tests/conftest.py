@@ -0,0 +1,122 @@
+import os
+import sys
+
+# The functions import each other as top-level modules (utils.*, model.*), as they do when deployed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep every store in memory and let the modules that create API clients at import time load
+os.environ.setdefault("OPEN_AI_KEY", "test")
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-test")
+os.environ.setdefault("MESSAGE_STORE_BACKEND", "sqlite")
+
+
+import re
+import threading
+from types import SimpleNamespace
+
+import pytest
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web import SlackResponse
+
+
+def slack_error(error: str, status_code: int = 200, headers: dict | None = None) -> SlackApiError:
+    response = SlackResponse(
+        client=None, http_verb="POST", api_url="", req_args={},
+        data={"ok": False, "error": error}, headers=headers or {}, status_code=status_code,
+    )
+    return SlackApiError(error, response)
+
+
+class FakeSlack:
+    """Serves channels and their histories from memory, two messages per page, newest first."""
+
+    def __init__(self):
+        self.channels: list[dict] = []
+        self.messages: dict[str, list[dict]] = {}
+        self.history_errors: dict[str, str] = {}
+        self.calls: list[tuple[str, dict]] = []
+
+    def add_channel(self, channel_id: str, timestamps: list[float], is_member: bool = True):
+        self.channels.append({"id": channel_id, "name": channel_id.lower(), "is_member": is_member})
+        self.messages[channel_id] = [
+            {"ts": f"{ts:.6f}", "user": "U1", "text": f"{channel_id} message at {ts:.0f}"} for ts in timestamps
+        ]
+
+    def conversations_list(self, cursor=None, **kwargs):
+        self.calls.append(("conversations.list", kwargs))
+        return {"channels": self.channels, "has_more": False, "response_metadata": {"next_cursor": ""}}
+
+    def conversations_join(self, channel, **kwargs):
+        self.calls.append(("conversations.join", {"channel": channel}))
+        return {"ok": True}
+
+    def conversations_history(self, channel, oldest=0, cursor=None, **kwargs):
+        self.calls.append(("conversations.history", {"channel": channel, "oldest": oldest, "cursor": cursor}))
+        if channel in self.history_errors:
+            raise slack_error(self.history_errors[channel])
+        newer = sorted(
+            (message for message in self.messages[channel] if float(message["ts"]) > float(oldest)),
+            key=lambda message: -float(message["ts"]),
+        )
+        start = int(cursor or 0)
+        return {
+            "messages": newer[start:start + 2],
+            "has_more": start + 2 < len(newer),
+            "response_metadata": {"next_cursor": str(start + 2)},
+        }
+
+    def called(self, method: str) -> list[dict]:
+        return [kwargs for name, kwargs in self.calls if name == method]
+
+
+class FakeTranslator:
+    """Stands in for the OpenAI client: "translates" the text after the prompt's instruction into upper case.
+
+    Answers longer than `max_answer_chars` are cut off there with finish_reason "length".
+    """
+
+    def __init__(self, max_answer_chars: int | None = None):
+        self.max_answer_chars = max_answer_chars
+        self.requests: list[str] = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens, temperature, **kwargs):
+        text = messages[-1]["content"].split(":\n\n", 1)[1]
+        with self._lock:
+            self.requests.append(text)
+        answer = re.sub(r"[a-z]+", lambda match: match.group().upper(), text)
+        finish_reason = "stop"
+        if self.max_answer_chars is not None and len(answer) > self.max_answer_chars:
+            answer, finish_reason = answer[:self.max_answer_chars], "length"
+        return SimpleNamespace(choices=[SimpleNamespace(finish_reason=finish_reason, message=SimpleNamespace(content=answer))])
+
+
+@pytest.fixture
+def fake_slack(monkeypatch):
+    from utils import slack_helper
+    from utils.channel_catalog import ChannelCatalog
+
+    slack = FakeSlack()
+    monkeypatch.setattr(slack_helper, "client", slack)
+    monkeypatch.setattr(slack_helper, "channel_catalog", ChannelCatalog(slack, ttl_seconds=3600))
+    return slack
+
+
+@pytest.fixture
+def message_store(monkeypatch):
+    from utils import slack_helper
+    from utils.message_store import SQLiteMessageStore
+
+    store = SQLiteMessageStore()
+    monkeypatch.setattr(slack_helper, "get_message_store", lambda: store)
+    return store
+
+
+@pytest.fixture
+def fake_translator(monkeypatch):
+    from utils import gpt_utils
+
+    translator = FakeTranslator()
+    monkeypatch.setattr(gpt_utils, "client", translator)
+    return translator
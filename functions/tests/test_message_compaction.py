@@ -0,0 +1,61 @@
+from model.message import MessageRecord
+from utils.message_compaction import compact_window
+from utils.message_window import MessageWindow
+from utils.token_utils import estimate_tokens
+
+
+def window(texts, subtypes=None):
+    subtypes = subtypes or [None] * len(texts)
+    return MessageWindow.from_records(
+        MessageRecord("C1", f"{1_700_000_000 + i}.000000", "U1", text, subtype)
+        for i, (text, subtype) in enumerate(zip(texts, subtypes))
+    )
+
+
+def test_drops_noise_and_exact_duplicates():
+    compacted, stats = compact_window(window(
+        ["Deploy finished", "lgtm :+1:", "<https://example.com|link>", "The API migration is done", "the API migration is done!"],
+        ["bot_message", None, None, None, None],
+    ))
+    assert compacted.texts == ["The API migration is done"]
+    assert (stats.noise_dropped, stats.duplicates_dropped, stats.trimmed) == (3, 1, 0)
+
+
+def test_drops_near_duplicates_but_keeps_distinct_messages():
+    compacted, stats = compact_window(window([
+        "Release 1.2 is out, see notes",
+        "Release 1.2 is out! See the notes",
+        "Build 41 passed",
+        "Build 42 passed",
+    ]))
+    assert compacted.texts == ["Release 1.2 is out, see notes", "Build 41 passed", "Build 42 passed"]
+    assert stats.duplicates_dropped == 1
+
+
+def test_budget_skips_messages_that_do_not_fit():
+    # The long message ranks first; it must not push every other message out
+    long_message = "incident " + " ".join(f"detail{i}" for i in range(3000))
+    texts = [long_message] + [f"topic{i} discussion about item{i} " + "word " * (i % 9) for i in range(80)]
+    compacted, stats = compact_window(window(texts), budget_tokens=300)
+    output_tokens = sum(estimate_tokens(text) for text in compacted.texts)
+    assert compacted.texts[0].startswith("incident detail0")
+    assert stats.kept_messages == len(compacted) > 1
+    # Messages that do not fit are skipped and smaller ones fill the rest of the budget
+    assert 300 - min(map(estimate_tokens, texts)) < output_tokens <= 300
+    assert list(compacted.ts) == sorted(compacted.ts)
+
+
+def test_long_message_is_cut_to_its_share_of_the_budget():
+    long_message = "incident " + " ".join(f"detail{i}" for i in range(3000))
+    compacted, stats = compact_window(window([long_message, "short update on the rollout"]), budget_tokens=2000)
+    assert len(compacted) == 2
+    assert compacted.texts[0].startswith("incident detail0") and compacted.texts[0].endswith("…")
+    assert estimate_tokens(compacted.texts[0]) <= 100
+    assert compacted.texts[1] == "short update on the rollout"
+
+
+def test_compaction_is_deterministic():
+    texts = [f"item{i % 37} changed by team{i % 11} after review{i % 5}" for i in range(500)]
+    first, _ = compact_window(window(texts), budget_tokens=800)
+    second, _ = compact_window(window(texts), budget_tokens=800)
+    assert first.texts == second.texts
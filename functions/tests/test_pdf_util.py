@@ -0,0 +1,75 @@
+import io
+import os
+
+import pytest
+from pypdf import PdfReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont
+
+from utils.pdf_util import JAPANESE_CID_FONT, LAYOUTS, PdfTextWriter
+
+TTF_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+
+@pytest.fixture(scope="module")
+def ttf_font():
+    if not os.path.exists(TTF_PATH):
+        pytest.skip(f"{TTF_PATH} is not installed")
+    pdfmetrics.registerFont(TTFont("TestDejaVuSans", TTF_PATH))
+    return "TestDejaVuSans"
+
+
+@pytest.fixture(scope="module")
+def cid_font():
+    pdfmetrics.registerFont(UnicodeCIDFont(JAPANESE_CID_FONT))
+    return JAPANESE_CID_FONT
+
+
+def render(lines, font_name, layout):
+    buffer = io.BytesIO()
+    with PdfTextWriter(buffer, font_name, LAYOUTS[layout]) as writer:
+        writer.write_lines(lines)
+    return PdfReader(io.BytesIO(buffer.getvalue()), strict=True)
+
+
+def extracted_lines(reader):
+    return [line.strip() for page in reader.pages for line in page.extract_text().splitlines() if line.strip()]
+
+
+def sheets(layout, lines):
+    """Sheets needed for `lines` lines that each fit on one line of the layout."""
+    writer = PdfTextWriter(io.BytesIO(), layout=LAYOUTS[layout])
+    per_sheet = writer._max_lines_per_page * LAYOUTS[layout].pages_per_sheet
+    return -(-lines // per_sheet)
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_standard_font_round_trip(layout):
+    lines = [f"Line {i}: café déjà vu" for i in range(300)]
+    reader = render(lines, "Helvetica", layout)
+    assert len(reader.pages) == sheets(layout, 300)
+    assert extracted_lines(reader) == lines
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_truetype_subset_round_trip(layout, ttf_font):
+    # More than 256 distinct characters, so the text spans several subsets
+    alphabet = "".join(map(chr, [*range(0x100, 0x250), *range(0x410, 0x450)]))
+    lines = [f"{i} {alphabet[i * 20 % len(alphabet):][:20]}" for i in range(300)]
+    reader = render(lines, ttf_font, layout)
+    assert len(reader.pages) == sheets(layout, 300)
+    assert extracted_lines(reader) == lines
+    fonts = {font.idnum: font.get_object() for page in reader.pages for font in page["/Resources"]["/Font"].values()}
+    assert len(fonts) == 2
+    assert all(font["/FontDescriptor"]["/FontFile2"] for font in fonts.values())
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_cid_font_round_trip(layout, cid_font):
+    lines = [f"{i} 週次レポート: リリース完了" for i in range(300)]
+    reader = render(lines, cid_font, layout)
+    assert len(reader.pages) == sheets(layout, 300)
+    assert extracted_lines(reader) == lines
+    font = next(iter(reader.pages[0]["/Resources"]["/Font"].values())).get_object()
+    assert font["/DescendantFonts"][0]["/FontDescriptor"]["/FontName"] == "/HeiseiKakuGo-W5"
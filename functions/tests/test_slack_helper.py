@@ -0,0 +1,67 @@
+from conftest import slack_error
+from utils import slack_helper
+
+NOW = 1_700_000_000.0
+
+
+def test_sync_resumes_from_high_water_mark(fake_slack, message_store):
+    fake_slack.add_channel("C1", [NOW - 100 * i for i in range(10)])
+    period = NOW - 450
+
+    window = slack_helper.fetch_message_window_for_period(period)
+    assert len(window) == 5
+    assert message_store.get_sync_state("C1") == (period, NOW)
+
+    # Only messages newer than the high water mark are requested again
+    fake_slack.messages["C1"].append({"ts": f"{NOW + 10:.6f}", "user": "U1", "text": "new"})
+    fake_slack.calls.clear()
+    window = slack_helper.fetch_message_window_for_period(period)
+    assert [call["oldest"] for call in fake_slack.called("conversations.history")] == [NOW]
+    assert len(window) == 6
+    assert message_store.get_sync_state("C1") == (period, NOW + 10)
+
+
+def test_sync_refetches_when_window_widens(fake_slack, message_store):
+    fake_slack.add_channel("C1", [NOW - 100 * i for i in range(10)])
+    slack_helper.fetch_message_window_for_period(NOW - 450)
+
+    # The store does not cover the older part of a wider window, so it is fetched from its start
+    fake_slack.calls.clear()
+    window = slack_helper.fetch_message_window_for_period(NOW - 1000)
+    assert fake_slack.called("conversations.history")[0]["oldest"] == NOW - 1000
+    assert len(window) == 10
+    assert message_store.get_sync_state("C1") == (NOW - 1000, NOW)
+
+    # A narrower window is covered and resumes from the high water mark
+    fake_slack.calls.clear()
+    window = slack_helper.fetch_message_window_for_period(NOW - 450)
+    assert [call["oldest"] for call in fake_slack.called("conversations.history")] == [NOW]
+    assert len(window) == 5
+
+
+def test_sync_rejoins_channel_after_not_in_channel(fake_slack, message_store):
+    fake_slack.add_channel("C1", [NOW])
+    fake_slack.add_channel("C2", [NOW])
+    fake_slack.history_errors["C2"] = "not_in_channel"
+
+    window = slack_helper.fetch_message_window_for_period(NOW - 100)
+    assert [window.channels[code] for code in window.channel_codes] == ["C1"]
+    assert message_store.get_sync_state("C2") is None
+    assert fake_slack.called("conversations.join") == []
+
+    # The bot was listed as a member, but that was stale; the next run joins again
+    del fake_slack.history_errors["C2"]
+    window = slack_helper.fetch_message_window_for_period(NOW - 100)
+    assert fake_slack.called("conversations.join") == [{"channel": "C2"}]
+    assert sorted(window.channels[code] for code in window.channel_codes) == ["C1", "C2"]
+
+
+def test_indexed_file_result_without_channel_names(fake_slack, monkeypatch):
+    def failing_list(**kwargs):
+        raise slack_error("ratelimited", status_code=429)
+
+    monkeypatch.setattr(fake_slack, "conversations_list", failing_list)
+    entry = {"file_id": "F1", "file_name": "plan.pdf", "file_url": "https://files/F1", "channel_ids": ["C1"]}
+    assert slack_helper._indexed_file_result(entry) == {
+        "channel": None, "file_id": "F1", "file_name": "plan.pdf", "file_url": "https://files/F1",
+    }
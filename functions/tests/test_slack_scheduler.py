@@ -0,0 +1,63 @@
+import pytest
+
+from conftest import slack_error
+from utils.slack_scheduler import SlackCallScheduler
+
+
+def scheduler(max_retries: int = 2) -> SlackCallScheduler:
+    return SlackCallScheduler({2: 6000, 3: 6000, 4: 6000}, max_retries)
+
+
+def rate_limited_then(result, failures: int):
+    attempts = []
+
+    def send():
+        attempts.append(1)
+        if len(attempts) <= failures:
+            raise slack_error("ratelimited", status_code=429, headers={"Retry-After": "0.01"})
+        return result
+
+    return send, attempts
+
+
+def test_calls_are_not_paced_before_rate_limit():
+    calls = scheduler()
+    for _ in range(100):
+        assert calls.call("users.list", lambda: "ok") == "ok"
+    assert calls.stats() == {"calls": 100, "throttled_calls": 0, "retries": 0, "wait_seconds": 0.0}
+
+
+def test_rate_limited_call_is_retried_and_method_paced():
+    calls = scheduler()
+    send, attempts = rate_limited_then("ok", failures=2)
+    assert calls.call("conversations.history", send) == "ok"
+    assert len(attempts) == 3
+    stats = calls.stats()
+    assert stats["retries"] == 2
+    assert stats["wait_seconds"] > 0
+    # Other methods keep their own, unpaced bucket
+    calls.call("users.info", lambda: "ok")
+    assert calls.stats()["throttled_calls"] == stats["throttled_calls"]
+
+
+def test_rate_limited_call_gives_up_after_max_retries():
+    calls = scheduler(max_retries=1)
+    send, attempts = rate_limited_then("ok", failures=5)
+    with pytest.raises(Exception) as error:
+        calls.call("conversations.history", send)
+    assert error.value.response.status_code == 429
+    assert len(attempts) == 2
+
+
+def test_other_errors_are_not_retried():
+    calls = scheduler()
+    attempts = []
+
+    def send():
+        attempts.append(1)
+        raise slack_error("channel_not_found")
+
+    with pytest.raises(Exception) as error:
+        calls.call("conversations.history", send)
+    assert error.value.response["error"] == "channel_not_found"
+    assert len(attempts) == 1
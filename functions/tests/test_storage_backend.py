@@ -0,0 +1,19 @@
+import pytest
+
+from utils.message_store import MessageStore, SQLiteMessageStore
+from utils.storage_backend import BackendSingleton
+from utils.summary_cache import SummaryCache
+from utils.translation_memory import TranslationMemory
+
+
+@pytest.mark.parametrize("base", [MessageStore, SummaryCache, TranslationMemory])
+def test_base_classes_are_abstract(base):
+    with pytest.raises(TypeError):
+        base()
+
+
+def test_singleton_creates_configured_backend_once():
+    created = []
+    singleton = BackendSingleton("sqlite", lambda: created.append(1) or SQLiteMessageStore(), lambda: pytest.fail("firestore"))
+    assert singleton.get() is singleton.get()
+    assert len(created) == 1
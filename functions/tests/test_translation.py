@@ -0,0 +1,39 @@
+from model.language import Language
+from utils import gpt_utils, translation_memory
+from utils.extract_file_text import TEXT_SECTION_SEPARATOR
+from utils.translation_memory import SQLiteTranslationMemory, iter_translate_with_memory
+
+
+def test_translated_segments_are_reassembled_in_order(fake_translator, monkeypatch):
+    monkeypatch.setattr(gpt_utils, "GPT_TRANSLATE_CHUNK_TOKENS", 60)
+    long_segment = "\n".join(f"line {i} of the long section" for i in range(40))
+    segments = ["first", "", "second short one", long_segment, "  ", "last"]
+
+    translated = list(gpt_utils.iter_translated_segments(segments, Language.SPANISH, max_workers=3))
+
+    assert translated == ["FIRST", "", "SECOND SHORT ONE", long_segment.upper(), "  ", "LAST"]
+    # The long segment was sent in several pieces
+    assert all(long_segment not in request for request in fake_translator.requests)
+
+
+def test_cut_off_translation_is_split_and_retried(fake_translator, monkeypatch):
+    fake_translator.max_answer_chars = 300
+    segment = " ".join(f"word{i}" for i in range(120))
+
+    translated = list(gpt_utils.iter_translated_segments([segment], Language.SPANISH))
+
+    assert translated == [segment.upper()]
+
+
+def test_translation_memory_sends_only_new_sections(fake_translator, monkeypatch):
+    memory = SQLiteTranslationMemory()
+    monkeypatch.setattr(translation_memory, "get_translation_memory", lambda: memory)
+    document = TEXT_SECTION_SEPARATOR.join(["intro", "body text", "intro", "", "outro"])
+
+    first = "".join(iter_translate_with_memory(document, Language.SPANISH))
+    assert first == TEXT_SECTION_SEPARATOR.join(["INTRO", "BODY TEXT", "INTRO", "", "OUTRO"])
+
+    fake_translator.requests.clear()
+    second = "".join(iter_translate_with_memory(document.replace("outro", "new ending"), Language.SPANISH))
+    assert second == TEXT_SECTION_SEPARATOR.join(["INTRO", "BODY TEXT", "INTRO", "", "NEW ENDING"])
+    assert fake_translator.requests == ["[[1]]\nnew ending"]
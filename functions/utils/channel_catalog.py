@@ -0,0 +1,86 @@
+import threading
+import time
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+
+class ChannelCatalog:
+    """Caches the workspace's channel list and the bot's channel membership.
+
+    `conversations_list` is only paged through again once the cached list is older
+    than `ttl_seconds`, and `conversations_join` is only called for channels the bot
+    is not a member of yet. Both are Tier 2/3 rate-limited, so on a warm instance
+    this saves hundreds of calls per report.
+    """
+
+    def __init__(self, client: WebClient, ttl_seconds: float):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self._channels: list[dict] = []
+        self._fetched_at: float | None = None
+        self._joined: set[str] = set()
+        self._lock = threading.Lock()
+
+    def channels(self, force_refresh: bool = False) -> list[dict]:
+        """Returns all channels visible to the bot, refreshing the cache when it expired."""
+        with self._lock:
+            expired = self._fetched_at is None or time.time() - self._fetched_at > self.ttl_seconds
+            if force_refresh or expired:
+                self._channels = self._list_channels()
+                self._fetched_at = time.time()
+                # Membership is rebuilt from Slack, so channels the bot was removed from are joined again
+                self._joined = {channel["id"] for channel in self._channels if channel.get("is_member")}
+            return self._channels
+
+    def _list_channels(self) -> list[dict]:
+        channels = []
+        response = self.client.conversations_list()
+        while response["channels"]:
+            channels.extend(response["channels"])
+            if not response["has_more"]:
+                break
+            response = self.client.conversations_list(
+                cursor=response["response_metadata"]["next_cursor"]
+            )
+        return channels
+
+    def ensure_joined(self, channel: dict) -> bool:
+        """Joins a channel unless the bot already is a member. Returns False if the join failed."""
+        if channel["id"] in self._joined:
+            return True
+        try:
+            self.client.conversations_join(channel=channel["id"])
+        except SlackApiError as join_error:
+            if join_error.response["error"] != "method_not_supported_for_channel_type":
+                print(
+                    f"Could not join channel {channel['name']}: {join_error.response['error']}"
+                )
+                return False
+        with self._lock:
+            self._joined.add(channel["id"])
+        return True
+
+    def forget_joined(self, channel_id: str) -> None:
+        """Drops a channel from the cached membership, e.g. after a `not_in_channel` error, so it is joined again."""
+        with self._lock:
+            self._joined.discard(channel_id)
+
+    def channels_active_since(self, oldest: float) -> list[dict]:
+        """Returns the channels that can have messages newer than `oldest`, without calling history."""
+        return [
+            channel for channel in self.channels()
+            if self.may_have_activity_since(channel, oldest)
+        ]
+
+    @staticmethod
+    def may_have_activity_since(channel: dict, oldest: float) -> bool:
+        """Tells from channel metadata alone whether a channel can have messages newer than `oldest`.
+
+        Nothing can be posted to an archived channel, and its `updated` field (in
+        milliseconds) is the time it was archived, so archived channels that were
+        archived before the window started are skipped.
+        """
+        if not channel.get("is_archived"):
+            return True
+        return channel.get("updated", 0) / 1000 > oldest
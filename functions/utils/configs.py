@@ -41,3 +41,78 @@ INDEXING_ONLY = os.environ.get("INDEXING_ONLY", "").lower() == "true"
 
 # notset, debug, info, warning, error, or critical
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "info")
+
+# Slack
+# Number of channels whose history is fetched concurrently when building reports
+SLACK_FETCH_MAX_WORKERS = int(os.environ.get("SLACK_FETCH_MAX_WORKERS") or 8)
+
+# Where synced Slack messages are persisted between report runs: "firestore" or "sqlite"
+MESSAGE_STORE_BACKEND = os.environ.get("MESSAGE_STORE_BACKEND", "firestore").lower()
+MESSAGE_STORE_SQLITE_PATH = os.environ.get("MESSAGE_STORE_SQLITE_PATH") or ":memory:"
+
+# How long the cached channel list and bot channel membership are reused, in seconds
+CHANNEL_CATALOG_TTL_SECONDS = float(os.environ.get("CHANNEL_CATALOG_TTL_SECONDS") or 600)
+
+# How long the file name index is used before new files are fetched from files.list, in seconds
+FILE_INDEX_TTL_SECONDS = float(os.environ.get("FILE_INDEX_TTL_SECONDS") or 60)
+
+# How long the cached Slack user directory is reused, in seconds
+USER_DIRECTORY_TTL_SECONDS = float(os.environ.get("USER_DIRECTORY_TTL_SECONDS") or 3600)
+
+# Calls per minute allowed for each method of a Slack rate limit tier; the scheduler paces each method to stay under them
+SLACK_TIER_REQUESTS_PER_MINUTE = {
+    tier: float(os.environ.get(f"SLACK_TIER{tier}_REQUESTS_PER_MINUTE") or default)
+    for tier, default in {1: 1, 2: 20, 3: 50, 4: 100}.items()
+}
+# How many times a rate limited Slack call is retried after waiting for Retry-After
+SLACK_MAX_RATE_LIMIT_RETRIES = int(os.environ.get("SLACK_MAX_RATE_LIMIT_RETRIES") or 5)
+
+# OpenAI
+GPT_MODEL = os.environ.get("GPT_MODEL") or "gpt-4"
+# Length limit of reports and translations
+GPT_MAX_OUTPUT_TOKENS = int(os.environ.get("GPT_MAX_OUTPUT_TOKENS") or 2048)
+# Faster model used for prompts of up to GPT_SMALL_MODEL_MAX_INPUT_TOKENS tokens; set it empty to always use GPT_MODEL
+GPT_SMALL_MODEL = os.environ.get("GPT_SMALL_MODEL", "gpt-4o-mini")
+GPT_SMALL_MODEL_MAX_INPUT_TOKENS = int(os.environ.get("GPT_SMALL_MODEL_MAX_INPUT_TOKENS") or 1500)
+# Deadline of an OpenAI call including its retries, in seconds; each attempt gets the time that is left
+GPT_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("GPT_REQUEST_TIMEOUT_SECONDS") or 120)
+# How many times an OpenAI call is retried after a rate limit, server or connection error
+GPT_MAX_RETRIES = int(os.environ.get("GPT_MAX_RETRIES") or 3)
+# Latency percentile after which a slow request is sent again and the first answer is used; 0 disables hedging
+GPT_HEDGE_PERCENTILE = float(os.environ.get("GPT_HEDGE_PERCENTILE") or 0)
+# Largest amount of input, in tokens, sent in one summarization request
+GPT_CHUNK_TOKENS = int(os.environ.get("GPT_CHUNK_TOKENS") or 5000)
+# Length limit of the intermediate summaries produced while summarizing large windows
+GPT_PARTIAL_SUMMARY_MAX_TOKENS = int(os.environ.get("GPT_PARTIAL_SUMMARY_MAX_TOKENS") or 512)
+# Number of concurrent OpenAI requests a single report or translation may make
+GPT_MAX_WORKERS = int(os.environ.get("GPT_MAX_WORKERS") or 4)
+# Largest amount of text, in tokens, translated in one request; it is lowered further for languages
+# whose translation takes more tokens, so the answer fits GPT_MAX_OUTPUT_TOKENS
+GPT_TRANSLATE_CHUNK_TOKENS = int(os.environ.get("GPT_TRANSLATE_CHUNK_TOKENS") or 1500)
+# Number of concurrent OpenAI requests used to translate one long document
+GPT_TRANSLATE_MAX_WORKERS = int(os.environ.get("GPT_TRANSLATE_MAX_WORKERS") or 8)
+# Most message tokens per week kept for reports after noise and duplicates are dropped; the least salient are trimmed
+REPORT_WEEK_TOKEN_BUDGET = int(os.environ.get("REPORT_WEEK_TOKEN_BUDGET") or 20000)
+
+# Where summaries of weekly message buckets are cached between report runs: "firestore" or "sqlite"
+SUMMARY_CACHE_BACKEND = os.environ.get("SUMMARY_CACHE_BACKEND", MESSAGE_STORE_BACKEND).lower()
+SUMMARY_CACHE_SQLITE_PATH = os.environ.get("SUMMARY_CACHE_SQLITE_PATH") or ":memory:"
+
+# Memory budget of the in-process cache of translated texts and their PDFs, in bytes
+TRANSLATION_CACHE_MAX_BYTES = int(os.environ.get("TRANSLATION_CACHE_MAX_BYTES") or 64 * 1024 * 1024)
+# Where translated document segments are remembered across invocations: "firestore" or "sqlite"
+TRANSLATION_MEMORY_BACKEND = os.environ.get("TRANSLATION_MEMORY_BACKEND", MESSAGE_STORE_BACKEND).lower()
+TRANSLATION_MEMORY_SQLITE_PATH = os.environ.get("TRANSLATION_MEMORY_SQLITE_PATH") or ":memory:"
+
+# PDF
+# Directory holding the TrueType fonts of scripts the built-in PDF fonts cannot show
+PDF_FONT_DIR = os.environ.get("PDF_FONT_DIR") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "fonts")
+# TrueType font file in PDF_FONT_DIR for each script; without it Japanese uses a built-in CID font and others Helvetica
+PDF_SCRIPT_FONTS = {
+    script: os.environ.get(f"PDF_{script.upper()}_FONT", default)
+    for script, default in {
+        "cyrillic": "NotoSans-Regular.ttf",
+        "devanagari": "NotoSansDevanagari-Regular.ttf",
+        "japanese": "NotoSansJP-Regular.ttf",
+    }.items()
+}
@@ -1,4 +1,5 @@
 import os
+import tempfile
 import epson_connect
 
 class EpsonConnectUtility:
@@ -29,3 +30,26 @@ class EpsonConnectUtility:
         except Exception as e:
             print(f"Failed to create print job: {e}")
             raise e
+
+
+def print_pdf_bytes(printer, pdf_bytes, settings=None) -> str:
+    """Print a PDF held in memory with an epson_connect printer and return the job ID.
+
+    The epson_connect client only uploads from a file path, so the PDF is
+    written to disk for the duration of the upload only.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+        pdf_file.write(pdf_bytes)
+        pdf_file.flush()
+        return printer.print(pdf_file.name, settings)
+
+
+def layout_print_settings(layout):
+    """Epson Connect print settings for a `pdf_util.PageLayout`, or None for the printer's defaults.
+
+    Compact layouts are printed on letter paper, two-sided as the layout asks.
+    """
+    if layout.two_sided == "none":
+        return None
+    # epson_connect fills in the other settings, so a new dict is built for every job
+    return {"print_setting": {"media_size": "ms_letter", "2_sided": layout.two_sided}}
@@ -0,0 +1,219 @@
+import heapq
+import threading
+import time
+from collections import Counter
+
+from slack_sdk import WebClient
+
+# Largest page size accepted by files.list
+_FILES_LIST_PAGE_SIZE = 1000
+
+# Fuzzy matches below this trigram similarity are not suggested
+_MIN_SIMILARITY = 0.3
+
+# Trigrams shared by more names than this are too common to find fuzzy
+# candidates with; they still count when the candidates are scored
+_MAX_CANDIDATE_POSTINGS = 500
+
+# Only the names sharing the most trigrams with the query get a similarity score
+_MAX_FUZZY_CANDIDATES = 50
+
+
+def _trigrams(text: str) -> frozenset[str]:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramIndex:
+    """In-memory trigram index over file names for case-insensitive fuzzy search.
+
+    Results are ranked by match kind (exact, prefix, substring, then typo-tolerant
+    trigram similarity) and, within a kind, by how recently the name was seen.
+    """
+
+    def __init__(self):
+        self._names: list[str] = []
+        self._normalized: list[str] = []
+        self._grams: list[frozenset[str]] = []
+        self._recency: list[float] = []
+        self._ids: dict[str, int] = {}
+        self._postings: dict[str, set[int]] = {}
+
+    def add(self, name: str, created: float) -> None:
+        name_id = self._ids.get(name)
+        if name_id is not None:
+            self._recency[name_id] = max(self._recency[name_id], created)
+            return
+        name_id = len(self._names)
+        normalized = name.lower()
+        grams = _trigrams(normalized)
+        self._ids[name] = name_id
+        self._names.append(name)
+        self._normalized.append(normalized)
+        self._grams.append(grams)
+        self._recency.append(created)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(name_id)
+
+    def search(self, query: str, limit: int = 5, newer_than: float | None = None) -> list[str]:
+        """Returns up to `limit` names that best match `query`, best match first.
+
+        With `newer_than`, only names last seen at or after that time are considered.
+        """
+        query = query.lower()
+        if not query:
+            return []
+        query_grams = _trigrams(query)
+
+        # Every name containing the query contains all of the query's inner trigrams
+        inner_grams = [query[i:i + 3] for i in range(len(query) - 2)]
+        if inner_grams:
+            postings = sorted(
+                (self._postings.get(gram, set()) for gram in inner_grams), key=len
+            )
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            # Queries shorter than a trigram are matched by scanning the names
+            candidates = {i for i, name in enumerate(self._normalized) if query in name}
+        if newer_than is not None:
+            candidates = {name_id for name_id in candidates if self._recency[name_id] >= newer_than}
+
+        # Typo-tolerant candidates are only needed when there are too few substring
+        # matches. They are found through the query's rarer trigrams only; a trigram
+        # like "pdf" would make every name a candidate
+        if len(candidates) < limit:
+            shared_grams = Counter()
+            for gram in query_grams:
+                if len(self._postings.get(gram, ())) <= _MAX_CANDIDATE_POSTINGS:
+                    shared_grams.update(self._postings.get(gram, ()))
+            if newer_than is not None:
+                for name_id in [name_id for name_id in shared_grams if self._recency[name_id] < newer_than]:
+                    del shared_grams[name_id]
+            candidates.update(name_id for name_id, _ in shared_grams.most_common(_MAX_FUZZY_CANDIDATES))
+        else:
+            top = self._top_substring_matches(query, candidates, limit)
+            if top is not None:
+                return top
+
+        ranked = []
+        for name_id in candidates:
+            name = self._normalized[name_id]
+            if name == query:
+                kind = 0
+            elif name.startswith(query):
+                kind = 1
+            elif query in name:
+                kind = 2
+            else:
+                grams = self._grams[name_id]
+                similarity = 2 * len(query_grams & grams) / (len(query_grams) + len(grams))
+                if similarity < _MIN_SIMILARITY:
+                    continue
+                ranked.append((3, -similarity, -self._recency[name_id], name_id))
+                continue
+            ranked.append((kind, 0.0, -self._recency[name_id], name_id))
+
+        return [self._names[name_id] for *_, name_id in heapq.nsmallest(limit, ranked)]
+
+    def _top_substring_matches(self, query: str, candidates: set[int], limit: int) -> list[str] | None:
+        """Returns the best `limit` names containing `query` without scoring every candidate, or None if there are fewer.
+
+        A short query like "pdf" has most names as candidates, and when at least
+        `limit` of them contain the query, no typo-tolerant match can rank high
+        enough to be returned.
+        """
+        normalized, recency = self._normalized, self._recency
+        candidates = [name_id for name_id in candidates if query in normalized[name_id]]
+        if len(candidates) < limit:
+            return None
+        # Exact and prefix matches come first, newest first within each
+        prefixed = [name_id for name_id in candidates if normalized[name_id].startswith(query)]
+        best = heapq.nsmallest(limit, prefixed, key=lambda name_id: (normalized[name_id] != query, -recency[name_id]))
+        if len(best) < limit:
+            # All prefix matches are in `best`, so the newest names not in it are the best substring matches
+            chosen = set(best)
+            newest = heapq.nlargest(2 * limit, candidates, key=recency.__getitem__)
+            best += [name_id for name_id in newest if name_id not in chosen][:limit - len(best)]
+        return [self._names[name_id] for name_id in best]
+
+
+class FileIndex:
+    """Maps Slack file names to the files shared in the workspace, newest first.
+
+    The index is built from `files.list` and then kept up to date incrementally:
+    once it is older than `ttl_seconds`, only files created since the newest
+    indexed file are requested. A lookup therefore costs at most a couple of
+    `files.list` calls instead of a crawl through every channel's history.
+    """
+
+    def __init__(self, client: WebClient, ttl_seconds: float):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self._by_name: dict[str, list[dict]] = {}
+        self._names = TrigramIndex()
+        self._indexed_from: float | None = None
+        self._latest_created = 0.0
+        self._refreshed_at: float | None = None
+        self._lock = threading.Lock()
+
+    def lookup(self, file_name: str, oldest: float) -> list[dict]:
+        """Returns the files named `file_name` created after `oldest`, newest first."""
+        with self._lock:
+            self._refresh(oldest)
+            return [entry for entry in self._by_name.get(file_name, []) if entry["created"] >= oldest]
+
+    def search(self, query: str, oldest: float, limit: int = 5) -> list[dict]:
+        """Returns the newest file for each of the names that best match `query`.
+
+        Matching is case-insensitive and tolerates typos; see `TrigramIndex`.
+        """
+        with self._lock:
+            self._refresh(oldest)
+            # Names are indexed for the whole window, so older ones are filtered out while ranking;
+            # a name's recency is its newest file's creation time
+            newer_than = oldest if oldest > self._indexed_from else None
+            return [self._by_name[name][0] for name in self._names.search(query, limit, newer_than=newer_than)]
+
+    def _refresh(self, oldest: float) -> None:
+        if self._indexed_from is None or oldest < self._indexed_from:
+            # Build (or widen) the index for the requested window
+            self._by_name = {}
+            self._names = TrigramIndex()
+            self._latest_created = 0.0
+            self._add_files(self._list_files(ts_from=oldest))
+            self._indexed_from = oldest
+        elif time.time() - self._refreshed_at > self.ttl_seconds:
+            # _latest_created is still 0 if the window had no files
+            self._add_files(self._list_files(ts_from=max(self._latest_created, self._indexed_from)))
+        else:
+            return
+        self._refreshed_at = time.time()
+
+    def _list_files(self, ts_from: float) -> list[dict]:
+        files = []
+        page = 1
+        while True:
+            response = self.client.files_list(
+                ts_from=int(ts_from), count=_FILES_LIST_PAGE_SIZE, page=page
+            )
+            files.extend(response["files"])
+            if page >= response["paging"]["pages"]:
+                break
+            page += 1
+        return files
+
+    def _add_files(self, files: list[dict]) -> None:
+        for file in files:
+            entries = self._by_name.setdefault(file["name"], [])
+            if any(entry["file_id"] == file["id"] for entry in entries):
+                continue
+            entries.append({
+                "channel_ids": file.get("channels", []) + file.get("groups", []),
+                "file_id": file["id"],
+                "file_name": file["name"],
+                "file_url": file["url_private"],
+                "created": float(file["created"]),
+            })
+            entries.sort(key=lambda entry: entry["created"], reverse=True)
+            self._names.add(file["name"], float(file["created"]))
+            self._latest_created = max(self._latest_created, float(file["created"]))
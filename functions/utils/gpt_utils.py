@@ -1,102 +1,402 @@
-from openai import OpenAI
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError
 import os
+import random
+import re
+import time
 from dotenv import load_dotenv
 from model.language import Language
+from utils.configs import GPT_CHUNK_TOKENS
+from utils.configs import GPT_HEDGE_PERCENTILE
+from utils.configs import GPT_MAX_OUTPUT_TOKENS
+from utils.configs import GPT_MAX_RETRIES
+from utils.configs import GPT_MAX_WORKERS
+from utils.configs import GPT_MODEL
+from utils.configs import GPT_PARTIAL_SUMMARY_MAX_TOKENS
+from utils.configs import GPT_REQUEST_TIMEOUT_SECONDS
+from utils.configs import GPT_SMALL_MODEL
+from utils.configs import GPT_SMALL_MODEL_MAX_INPUT_TOKENS
+from utils.configs import GPT_TRANSLATE_CHUNK_TOKENS
+from utils.configs import GPT_TRANSLATE_MAX_WORKERS
+from utils.model_router import ModelRouter
+from utils.summarizer import map_reduce_summarize
+from utils.token_utils import context_tokens, estimate_tokens, pack_chunks
 
 load_dotenv()
 
 open_ai_key = os.getenv("OPEN_AI_KEY")
 
+# Part of the summary cache key; bump it when the summarization prompts change
+SUMMARY_PROMPT_VERSION = 1
+# Part of the translation cache key; bump it when the translation prompt changes
+TRANSLATE_PROMPT_VERSION = 1
+
+# Separates the numbered segments of a batch translation request
+_SEGMENT_MARKER = re.compile(r"^\[\[(\d+)\]\][ \t]*\n?", re.MULTILINE)
+_SEGMENT_MARKER_TOKENS = 6
+
+# How many times more tokens a translation into each language takes than English text,
+# as estimate_tokens counts them, with some margin; other languages use the default
+_TRANSLATION_EXPANSION = {
+    Language.HINDI: 4.5,
+    Language.JAPANESE: 3.0,
+    Language.RUSSIAN: 3.5,
+}
+_DEFAULT_TRANSLATION_EXPANSION = 1.5
+
+
+class TruncatedAnswerError(Exception):
+    """Raised when the model stopped at the output token limit before finishing its answer."""
+
+# Errors worth retrying: rate limits, server errors, and timeouts or dropped connections
+_RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+# Retries are made by _with_retries, which knows how much of the call's deadline is left;
+# the SDK's own retries would each start a fresh timeout
 client = OpenAI(
-    api_key=open_ai_key
+    api_key=open_ai_key,
+    max_retries=0,
 )
 
-def gpt_generate_weekly_report(text: str) -> str:
-    try:
-        chat_completion = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates weekly reports from text."},
-                {
-                    "role": "user",
-                    "content": f"Based on the following messages, generate a weekly report in bullet points summarizing key events and updates:\n\n{text}"
-                }
-            ],
-            max_tokens=2048,
-            temperature=0  # Keeps it factual and precise
+router = ModelRouter(
+    large_model=GPT_MODEL,
+    small_model=GPT_SMALL_MODEL or None,
+    small_model_max_input_tokens=GPT_SMALL_MODEL_MAX_INPUT_TOKENS,
+    hedge_percentile=GPT_HEDGE_PERCENTILE,
+)
+
+def _route_checked(system_prompt: str, user_prompt: str, max_tokens: int):
+    # Pick the model by prompt size, and check the prompt fits it locally instead of finding out from an API error
+    model, check = router.route([system_prompt, user_prompt], max_tokens)
+    if not check.fits:
+        raise ValueError(
+            f"Prompt of about {check.input_tokens} tokens does not fit the {model} context window"
         )
+    return model, check
+
+def _with_retries(model: str, send):
+    """Runs `send(timeout)`, retrying retryable errors until GPT_MAX_RETRIES or the call's deadline runs out."""
+    deadline = time.monotonic() + GPT_REQUEST_TIMEOUT_SECONDS
+    attempt = 0
+    while True:
+        try:
+            # Every attempt, and any hedged copy of it, only gets the time left before the deadline
+            return send(deadline - time.monotonic())
+        except _RETRYABLE_ERRORS as e:
+            delay = _retry_delay(e, attempt)
+            if attempt >= GPT_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                raise
+            print(f"{model} request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+def _chat(system_prompt: str, user_prompt: str, max_tokens: int = GPT_MAX_OUTPUT_TOKENS, require_complete: bool = False) -> str:
+    """Returns the model's answer to a prompt.
+
+    With `require_complete`, an answer cut off at the output token limit raises
+    TruncatedAnswerError instead of being returned.
+    """
+    model, check = _route_checked(system_prompt, user_prompt, max_tokens)
+    chat_completion = _with_retries(model, lambda timeout: router.call(model, lambda: client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        max_tokens=check.max_tokens,
+        temperature=0,  # Keeps it factual and precise
+        timeout=timeout,
+    )))
+    choice = chat_completion.choices[0]
+    if choice.finish_reason == "length":
+        if require_complete:
+            raise TruncatedAnswerError(f"{model} answer was cut off at {check.max_tokens} tokens")
+        print(f"{model} answer was cut off at {check.max_tokens} tokens")
+    return choice.message.content.strip()
+
+def _chat_stream(system_prompt: str, user_prompt: str, max_tokens: int = GPT_MAX_OUTPUT_TOKENS) -> Iterator[str]:
+    """Like _chat, but yields the answer in fragments as the model generates it.
+
+    Opening the stream is retried like _chat; streams are not hedged.
+    """
+    model, check = _route_checked(system_prompt, user_prompt, max_tokens)
+    start = time.monotonic()
+    stream = _with_retries(model, lambda timeout: client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        max_tokens=check.max_tokens,
+        temperature=0,  # Keeps it factual and precise
+        stream=True,
+        timeout=timeout,
+    ))
+    started = False
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        content = choice.delta.content
+        if content:
+            # Like _chat's strip(), drop the whitespace the answer starts with
+            if not started:
+                content = content.lstrip()
+                started = bool(content)
+            if content:
+                yield content
+        if choice.finish_reason == "length":
+            print(f"{model} answer was cut off at {check.max_tokens} tokens")
+    router.record(model, time.monotonic() - start)
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying: the server's Retry-After if it sent one, otherwise jittered exponential backoff."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return 0.5 * 2 ** attempt * (1 + random.random())
+
+def _input_budget(system_prompt: str, max_tokens: int) -> int:
+    """Tokens of content that fit in one request next to the instructions and the answer."""
+    # Leave room for the instruction line that precedes the content
+    instructions_tokens = estimate_tokens(system_prompt) + 100
+    return min(GPT_CHUNK_TOKENS, context_tokens(router.large_model) - max_tokens - instructions_tokens)
+
+def _summarize_messages(text: str) -> str:
+    return _chat(
+        "You are a helpful assistant that summarizes team messages.",
+        f"Summarize the key events and updates in the following messages as concise bullet points:\n\n{text}",
+        max_tokens=GPT_PARTIAL_SUMMARY_MAX_TOKENS,
+    )
+
+def _combine_summaries(text: str) -> str:
+    return _chat(
+        "You are a helpful assistant that summarizes team messages.",
+        f"Merge the following summaries into one set of concise bullet points, keeping the most important events and updates:\n\n{text}",
+        max_tokens=GPT_PARTIAL_SUMMARY_MAX_TOKENS,
+    )
+
+def _generate_period_report(messages: list[str], system_prompt: str, instructions: str) -> Iterator[str]:
+    """Generates a report in one request if the messages fit, otherwise with map-reduce summarization.
+
+    Each message is kept whole within one chunk, even when it spans several lines.
+    Any map-reduce rounds run before this returns; the final report is then
+    yielded in fragments as the model generates it.
+    """
+    def prompt(content: str, from_summaries: bool) -> str:
+        source = "summaries of team messages" if from_summaries else "messages"
+        return f"Based on the following {source}, {instructions}:\n\n{content}"
+
+    def finish(content: str, from_summaries: bool) -> Iterator[str]:
+        return _chat_stream(system_prompt, prompt(content, from_summaries))
+
+    # Only go single-shot if the whole report still fits next to the messages; a
+    # nearly full context would leave the report a few hundred tokens
+    text = "\n".join(messages)
+    _, check = router.route([system_prompt, prompt(text, False)], GPT_MAX_OUTPUT_TOKENS, min_output_tokens=GPT_MAX_OUTPUT_TOKENS)
+    if check.fits:
+        return finish(text, False)
 
-        result = chat_completion.choices[0].message.content.strip()
-        return result
+    return map_reduce_summarize(
+        messages,
+        summarize=_summarize_messages,
+        combine=_combine_summaries,
+        finish=finish,
+        budget_tokens=_input_budget(system_prompt, GPT_MAX_OUTPUT_TOKENS),
+        max_workers=GPT_MAX_WORKERS,
+    )
+
+def _generate_report_from_summaries(summaries: list[str], system_prompt: str, instructions: str) -> Iterator[str]:
+    """Generates a report from time-ordered bucket summaries, combining them first if they do not fit one request.
+
+    The report is yielded in fragments as the model generates it.
+    """
+    def finish(content: str, from_summaries: bool) -> Iterator[str]:
+        return _chat_stream(system_prompt, f"Based on the following summaries of team messages, {instructions}:\n\n{content}")
+
+    return map_reduce_summarize(
+        summaries,
+        summarize=_combine_summaries,
+        combine=_combine_summaries,
+        finish=finish,
+        budget_tokens=_input_budget(system_prompt, GPT_MAX_OUTPUT_TOKENS),
+        max_workers=GPT_MAX_WORKERS,
+    )
+
+def gpt_summarize_messages(messages: list[str]) -> str:
+    """Summarizes one time bucket of messages. Bump SUMMARY_PROMPT_VERSION when the prompts change."""
+    def finish(content: str, from_summaries: bool) -> str:
+        return _combine_summaries(content) if from_summaries else _summarize_messages(content)
+
+    return map_reduce_summarize(
+        messages,
+        summarize=_summarize_messages,
+        combine=_combine_summaries,
+        finish=finish,
+        budget_tokens=_input_budget("You are a helpful assistant that summarizes team messages.", GPT_PARTIAL_SUMMARY_MAX_TOKENS),
+        max_workers=GPT_MAX_WORKERS,
+    )
+
+def gpt_generate_weekly_report(messages: list[str]) -> Iterator[str]:
+    try:
+        return _generate_period_report(
+            messages,
+            "You are a helpful assistant that generates weekly reports from text.",
+            "generate a weekly report in bullet points summarizing key events and updates",
+        )
 
     except Exception as e:
         print(f"Failed to generate weekly report: {e}")
         raise e
-    
-def gpt_generate_monthly_report(text: str) -> str:
+
+def gpt_generate_monthly_report_from_summaries(summaries: list[str]) -> Iterator[str]:
     try:
-        chat_completion = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates weekly reports from text."},
-                {
-                    "role": "user",
-                    "content": f"Based on the following messages, generate a monthly report in bullet points summarizing key events and updates:\n\n{text}"
-                }
-            ],
-            max_tokens=2048,
-            temperature=0  # Keeps it factual and precise
+        return _generate_report_from_summaries(
+            summaries,
+            "You are a helpful assistant that generates monthly reports from text.",
+            "generate a monthly report in bullet points summarizing key events and updates",
         )
 
-        result = chat_completion.choices[0].message.content.strip()
-        return result
-
     except Exception as e:
-        print(f"Failed to generate weekly report: {e}")
+        print(f"Failed to generate monthly report: {e}")
         raise e
 
-def gpt_generate_yearly_report(text: str) -> str:
+def gpt_generate_yearly_report_from_summaries(summaries: list[str]) -> Iterator[str]:
     try:
-        chat_completion = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates yearly reports from text."},
-                {
-                    "role": "user",
-                    "content": f"Based on the following messages, generate a yearly report in bullet points summarizing key events and updates throughout the year:\n\n{text}"
-                }
-            ],
-            max_tokens=2048,
-            temperature=0  # Keeps it factual and precise
+        return _generate_report_from_summaries(
+            summaries,
+            "You are a helpful assistant that generates yearly reports from text.",
+            "generate a yearly report in bullet points summarizing key events and updates throughout the year",
         )
 
-        result = chat_completion.choices[0].message.content.strip()
-        return result
-
     except Exception as e:
         print(f"Failed to generate yearly report: {e}")
         raise e
 
+def _translate_chunk_budget(language: Language) -> int:
+    """Tokens of source text per request whose translation is expected to fit GPT_MAX_OUTPUT_TOKENS."""
+    expansion = _TRANSLATION_EXPANSION.get(language, _DEFAULT_TRANSLATION_EXPANSION)
+    return max(1, min(GPT_TRANSLATE_CHUNK_TOKENS, int(GPT_MAX_OUTPUT_TOKENS / expansion)))
+
+def _translate_chunk(text: str, language: Language) -> str:
+    """Translates `text`, splitting it and translating the halves if the answer does not fit the output limit."""
+    try:
+        return _chat(
+            "You are a helpful assistant that translates text.",
+            f"Please translate the following text into {language.value}:\n\n{text}",
+            require_complete=True,
+        )
+    except TruncatedAnswerError:
+        pieces = pack_chunks([text], max(1, estimate_tokens(text) // 2), separator="")
+        if len(pieces) < 2:
+            raise
+        print(f"Translation of about {estimate_tokens(text)} tokens was cut off, translating it in {len(pieces)} pieces")
+        return "".join(_translate_chunk(piece, language) + piece[len(piece.rstrip()):] for piece in pieces).rstrip()
 
-def translate(text: str, language: Language) -> str:
+def _translate_batch(segments: list[str], language: Language) -> list[str]:
+    # Number the segments so the translations can be matched back to them
+    numbered = "\n\n".join(f"[[{i}]]\n{segment}" for i, segment in enumerate(segments, 1))
     try:
-        chat_completion = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that translates text."},
-                {
-                    "role": "user",
-                    "content": f"Please translate the following text into {language.value}:\n\n{text}"
-                }
-            ],
-            max_tokens=2048,
-            temperature=0  # Keeps it factual and precise
+        answer = _chat(
+            "You are a helpful assistant that translates text. Keep every [[n]] marker unchanged on its own line "
+            "and put the translation of each segment after its marker.",
+            f"Please translate the following numbered segments into {language.value}:\n\n{numbered}",
+            require_complete=True,
         )
+    except TruncatedAnswerError:
+        if len(segments) == 1:
+            return [_translate_chunk(segments[0], language)]
+        print(f"Batch translation of {len(segments)} segments was cut off, translating it in two halves")
+        middle = len(segments) // 2
+        return _translate_batch(segments[:middle], language) + _translate_batch(segments[middle:], language)
+    parts = _SEGMENT_MARKER.split(answer)
+    # parts is [preamble, number, translation, number, translation, ...]
+    translations = {int(number): translation.strip("\n") for number, translation in zip(parts[1::2], parts[2::2])}
+    if sorted(translations) != list(range(1, len(segments) + 1)):
+        print(f"Batch translation lost its segment markers, translating {len(segments)} segments one by one")
+        return [_translate_chunk(segment, language) for segment in segments]
+    return [translations[i] for i in range(1, len(segments) + 1)]
 
-        result = chat_completion.choices[0].message.content.strip()
-        return result
+def _split_long_segment(segment: str, budget_tokens: int) -> list[tuple[str, str]]:
+    # Pieces break on line or word boundaries; remember the whitespace the answer will not keep
+    pieces = pack_chunks([segment], budget_tokens, separator="")
+    return [(piece, piece[len(piece.rstrip()):]) for piece in pieces]
 
-    except Exception as e:
-        print(f"Failed to generate translation: {e}")
-        raise e
+def _plan_translation(segments: list[str], language: Language) -> list[tuple]:
+    # Each job translates either a batch of whole segments or one piece of a long segment.
+    # Jobs are in segment order, so their results can be emitted as soon as they are done.
+    # Requests are sized by the expected length of the answer, which grows with the target script.
+    budget_tokens = _translate_chunk_budget(language)
+    jobs = []
+    batch, batch_indices, batch_tokens = [], [], 0
+    for index, segment in enumerate(segments):
+        if not segment.strip():
+            continue
+        segment_tokens = estimate_tokens(segment) + _SEGMENT_MARKER_TOKENS
+        if batch and (segment_tokens > budget_tokens or batch_tokens + segment_tokens > budget_tokens):
+            jobs.append(("batch", batch_indices, batch))
+            batch, batch_indices, batch_tokens = [], [], 0
+        if segment_tokens > budget_tokens:
+            jobs.extend(("piece", index, piece) for piece in _split_long_segment(segment, budget_tokens))
+            continue
+        batch.append(segment)
+        batch_indices.append(index)
+        batch_tokens += segment_tokens
+    if batch:
+        jobs.append(("batch", batch_indices, batch))
+    return jobs
+
+def iter_translated_segments(segments: list[str], language: Language, max_workers: int = GPT_TRANSLATE_MAX_WORKERS) -> Iterator[str]:
+    """Translates independent segments (e.g. paragraphs) with up to `max_workers` concurrent requests.
+
+    Short segments are batched several per request, and a segment too long for
+    one request is split on line or word boundaries. Translations are yielded in
+    the order of `segments`, each as soon as it and all segments before it are
+    done; blank segments are yielded unchanged. At most twice `max_workers`
+    jobs are started ahead of the one being yielded, and a job's result is
+    dropped once it has been yielded, so memory does not grow with the document.
+    """
+    jobs = _plan_translation(segments, language)
+    lookahead = 2 * max(1, max_workers)
+
+    def run(job):
+        kind, _, payload = job
+        if kind == "batch":
+            return _translate_batch(payload, language)
+        piece, trailing_whitespace = payload
+        return _translate_chunk(piece, language) + trailing_whitespace
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = [None] * len(jobs)
+        submitted = 0
+        next_index, pieces = 0, None
+        for position, (kind, target, _) in enumerate(jobs):
+            while submitted < min(len(jobs), position + lookahead):
+                futures[submitted] = executor.submit(run, jobs[submitted])
+                submitted += 1
+            result = futures[position].result()
+            futures[position] = None
+            if kind == "batch":
+                for index, translation in zip(target, result):
+                    yield from segments[next_index:index]
+                    yield translation
+                    next_index = index + 1
+                continue
 
+            # Pieces of a long segment are consecutive jobs; join them into one segment
+            if pieces is None:
+                yield from segments[next_index:target]
+                pieces = []
+            pieces.append(result)
+            if position + 1 == len(jobs) or jobs[position + 1][1] != target:
+                yield "".join(pieces)
+                next_index = target + 1
+                pieces = None
+        yield from segments[next_index:]
+    finally:
+        # Stop pending requests if the consumer gives up early
+        executor.shutdown(wait=False, cancel_futures=True)
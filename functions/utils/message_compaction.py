@@ -0,0 +1,258 @@
+import re
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.message_window import MessageWindow
+from utils.token_utils import estimate_tokens
+
+# Slack message subtypes that never carry report-worthy content
+NOISE_SUBTYPES = {
+    "bot_add",
+    "bot_message",
+    "bot_remove",
+    "channel_archive",
+    "channel_join",
+    "channel_leave",
+    "channel_name",
+    "channel_purpose",
+    "channel_topic",
+    "channel_unarchive",
+    "group_join",
+    "group_leave",
+    "pinned_item",
+    "reminder_add",
+    "tombstone",
+    "unpinned_item",
+}
+
+# Short replies that only acknowledge another message
+ACKNOWLEDGEMENTS = {
+    "ack", "agreed", "awesome", "cool", "done", "great", "haha", "k", "kk", "lgtm", "lol", "nice", "no",
+    "nope", "ok", "okay", "sounds", "good", "sure", "thank", "thanks", "thx", "ty", "yes", "yep", "yup",
+}
+
+# Links, mentions and channel references (<...>), emoji codes (:smile:) and "+1"
+_MARKUP_PATTERN = re.compile(r"<[^>]*>|:[a-z0-9_+'\-]+:|\+1")
+_WORD_PATTERN = re.compile(r"[^\W_]+")
+
+# Messages whose words and word pairs overlap at least this much (Jaccard similarity) are near-duplicates
+NEAR_DUPLICATE_SIMILARITY = 0.7
+# MinHash signature of each message, split into LSH bands; a pair of messages is only compared
+# when all the rows of one band match, which catches 96% of pairs at the similarity threshold
+_MINHASH_BANDS = 8
+_MINHASH_ROWS = 3
+_MINHASH_SEEDS = np.random.default_rng(0).integers(1, 2**63, size=(2, _MINHASH_BANDS * _MINHASH_ROWS), dtype=np.uint64) | np.uint64(1)
+_MINHASH_ROW_MIXERS = np.array([1, 0x9E3779B1, 0x85EBCA77], dtype=np.uint64)
+
+# A single message may take at most this fraction of the token budget; longer ones are cut
+MAX_MESSAGE_BUDGET_FRACTION = 0.05
+
+
+@dataclass
+class CompactionStats:
+    input_messages: int
+    noise_dropped: int
+    duplicates_dropped: int
+    trimmed: int
+    input_tokens: int
+    output_tokens: int
+
+    @property
+    def kept_messages(self) -> int:
+        return self.input_messages - self.noise_dropped - self.duplicates_dropped - self.trimmed
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.input_tokens - self.output_tokens
+
+
+def _salience(words: list[list[str]]) -> np.ndarray:
+    """Scores messages by the TF-IDF weight of their words, damped by length so long messages do not win by size alone."""
+    vocabulary: dict[str, int] = {}
+    term_ids = np.fromiter(
+        (vocabulary.setdefault(word, len(vocabulary)) for message_words in words for word in message_words),
+        dtype=np.int64,
+    )
+    lengths = np.fromiter((len(message_words) for message_words in words), dtype=np.int64, count=len(words))
+    doc_ids = np.repeat(np.arange(len(words), dtype=np.int64), lengths)
+    if not len(term_ids):
+        return np.zeros(len(words))
+
+    # Term frequency of each (message, word) pair, and in how many messages each word occurs
+    pairs, term_frequency = np.unique(doc_ids * len(vocabulary) + term_ids, return_counts=True)
+    pair_docs, pair_terms = np.divmod(pairs, len(vocabulary))
+    document_frequency = np.bincount(pair_terms, minlength=len(vocabulary))
+    idf = np.log((1 + len(words)) / (1 + document_frequency)) + 1
+
+    weights = (1 + np.log(term_frequency)) * idf[pair_terms]
+    return np.bincount(pair_docs, weights=weights, minlength=len(words)) / np.sqrt(lengths + 1)
+
+
+def _shingle_hashes(words: list[list[str]]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Hashes the words and adjacent word pairs of every message.
+
+    Returns the word hashes and pair hashes of all messages laid end to end,
+    and the start of each message in them. Pair k joins words k and k + 1;
+    the last word of a message has no pair and repeats its word hash instead.
+    CRC32 keeps the hashes the same in every process.
+    """
+    vocabulary: dict[str, int] = {}
+    term_ids = np.fromiter(
+        (vocabulary.setdefault(word, len(vocabulary)) for message_words in words for word in message_words),
+        dtype=np.int64,
+    )
+    word_hashes = np.fromiter((zlib.crc32(word.encode()) for word in vocabulary), dtype=np.uint64, count=len(vocabulary))
+    unigrams = word_hashes[term_ids]
+    lengths = np.fromiter((len(message_words) for message_words in words), dtype=np.int64, count=len(words))
+    starts = np.r_[0, np.cumsum(lengths)[:-1]].astype(np.int64)
+
+    bigrams = unigrams.copy()
+    bigrams[:-1] = (unigrams[:-1] * np.uint64(0x9E3779B97F4A7C15)) ^ unigrams[1:]
+    last_words = starts + lengths - 1
+    bigrams[last_words] = unigrams[last_words]
+    return unigrams, bigrams, starts
+
+
+def _near_duplicates(words: list[list[str]]) -> np.ndarray:
+    """Flags each message that is a near-duplicate of an earlier message that was not itself flagged.
+
+    Candidates are found with MinHash and locality-sensitive hashing, then
+    confirmed with the exact Jaccard similarity of their shingles, so only
+    messages that share a band are ever compared.
+    """
+    duplicates = np.zeros(len(words), dtype=bool)
+    if not words:
+        return duplicates
+    unigrams, bigrams, starts = _shingle_hashes(words)
+    ends = np.r_[starts[1:], len(unigrams)]
+
+    # One multiply-shift hash function per signature row; the minimum over a message's shingles is its MinHash
+    signature = np.empty((len(words), _MINHASH_BANDS * _MINHASH_ROWS), dtype=np.uint64)
+    for row, (multiplier, offset) in enumerate(_MINHASH_SEEDS.T):
+        signature[:, row] = np.minimum(
+            np.minimum.reduceat((unigrams * multiplier + offset) >> np.uint64(32), starts),
+            np.minimum.reduceat((bigrams * multiplier + offset) >> np.uint64(32), starts),
+        )
+    bands = signature.reshape(len(words), _MINHASH_BANDS, _MINHASH_ROWS)
+    band_keys = np.bitwise_xor.reduce(bands * _MINHASH_ROW_MIXERS, axis=2)
+
+    # Only messages that share a band key with another message can be near-duplicates
+    involved = np.zeros(len(words), dtype=bool)
+    for band in range(_MINHASH_BANDS):
+        _, inverse, counts = np.unique(band_keys[:, band], return_inverse=True, return_counts=True)
+        involved |= counts[inverse] > 1
+
+    buckets: list[dict[int, list[int]]] = [{} for _ in range(_MINHASH_BANDS)]
+    shingles: dict[int, set[int]] = {}
+    for i in np.flatnonzero(involved).tolist():
+        keys = band_keys[i].tolist()
+        candidates = sorted({j for band, key in enumerate(keys) for j in buckets[band].get(key, ())})
+        message = set(unigrams[starts[i]:ends[i]].tolist()) | set(bigrams[starts[i]:ends[i]].tolist())
+        if any(
+            len(message & shingles[j]) >= NEAR_DUPLICATE_SIMILARITY * len(message | shingles[j])
+            for j in candidates
+        ):
+            duplicates[i] = True
+            continue
+        shingles[i] = message
+        for band, key in enumerate(keys):
+            buckets[band].setdefault(key, []).append(i)
+    return duplicates
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cuts `text` to about `max_tokens` tokens at a word boundary, marking the cut with an ellipsis."""
+    end = len(text)
+    # One token is left for the ellipsis
+    while end > 1 and estimate_tokens(text[:end]) >= max_tokens:
+        end = end * 3 // 4
+    cut = text.rfind(" ", 0, end)
+    return text[:cut if cut > end // 2 else end].rstrip() + " …"
+
+
+def compact_window(window: MessageWindow, budget_tokens: int | None = None) -> tuple[MessageWindow, CompactionStats]:
+    """Drops noise and duplicates from a window and keeps its most informative messages within `budget_tokens`.
+
+    Messages with a noise subtype, messages that are only links, mentions,
+    emoji or acknowledgements, and messages that repeat or nearly repeat an
+    earlier message are dropped. With a budget, a message longer than
+    MAX_MESSAGE_BUDGET_FRACTION of it is cut to that length, and if the rest
+    still exceeds the budget, messages are ranked by TF-IDF salience and taken
+    best first, skipping any that no longer fit. The result stays in time order.
+    """
+    noise_codes = np.array([subtype in NOISE_SUBTYPES for subtype in window.subtypes], dtype=bool)
+    is_noise_subtype = noise_codes[window.subtype_codes] if len(window.subtypes) else np.zeros(0, dtype=bool)
+
+    keep, words, tokens = [], [], []
+    seen = set()
+    noise_dropped = duplicates_dropped = input_tokens = 0
+    for i, text in enumerate(window.texts):
+        message_tokens = estimate_tokens(text)
+        input_tokens += message_tokens
+        if is_noise_subtype[i]:
+            noise_dropped += 1
+            continue
+        message_words = _WORD_PATTERN.findall(_MARKUP_PATTERN.sub(" ", text).lower())
+        if not message_words or (len(message_words) <= 3 and ACKNOWLEDGEMENTS.issuperset(message_words)):
+            noise_dropped += 1
+            continue
+        # Exact cross-posts and repeats differ at most in case, punctuation, links and mentions
+        normalized = " ".join(message_words)
+        if normalized in seen:
+            duplicates_dropped += 1
+            continue
+        seen.add(normalized)
+        keep.append(i)
+        words.append(message_words)
+        tokens.append(message_tokens)
+
+    # Reworded repeats, e.g. "Release 1.2 is out, see notes" and "Release 1.2 is out! See the notes"
+    near_duplicates = _near_duplicates(words)
+    duplicates_dropped += int(near_duplicates.sum())
+    unique = np.flatnonzero(~near_duplicates)
+    keep = np.asarray(keep, dtype=np.int64)[unique]
+    tokens = np.asarray(tokens, dtype=np.int64)[unique]
+    words = [words[i] for i in unique]
+
+    trimmed = 0
+    max_message_tokens = None
+    if budget_tokens is not None:
+        max_message_tokens = max(1, int(budget_tokens * MAX_MESSAGE_BUDGET_FRACTION))
+        tokens = np.minimum(tokens, max_message_tokens)
+    if budget_tokens is not None and tokens.sum() > budget_tokens:
+        # Take messages best first; one that does not fit is skipped, not the end of the selection
+        order = np.argsort(-_salience(words), kind="stable")
+        selected, remaining = [], budget_tokens
+        smallest = int(tokens.min())
+        for position in order.tolist():
+            if tokens[position] <= remaining:
+                selected.append(position)
+                remaining -= int(tokens[position])
+                if remaining < smallest:
+                    break
+        selected = np.sort(np.asarray(selected, dtype=np.int64))
+        trimmed = len(keep) - len(selected)
+        keep, tokens = keep[selected], tokens[selected]
+
+    compacted = window.take(keep)
+    if max_message_tokens is not None:
+        for i, text in enumerate(compacted.texts):
+            if len(text) > max_message_tokens and estimate_tokens(text) > max_message_tokens:
+                compacted.texts[i] = _truncate(text, max_message_tokens)
+
+    stats = CompactionStats(
+        input_messages=len(window),
+        noise_dropped=noise_dropped,
+        duplicates_dropped=duplicates_dropped,
+        trimmed=trimmed,
+        input_tokens=input_tokens,
+        output_tokens=sum(estimate_tokens(text) for text in compacted.texts),
+    )
+    print(
+        f"Compaction kept {stats.kept_messages} of {stats.input_messages} messages "
+        f"({noise_dropped} noise, {duplicates_dropped} duplicates, {trimmed} over budget), "
+        f"saving {stats.tokens_saved} of {input_tokens} tokens"
+    )
+    return compacted, stats
@@ -0,0 +1,209 @@
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+
+from model.message import MessageRecord
+from utils.configs import MESSAGE_STORE_BACKEND
+from utils.configs import MESSAGE_STORE_SQLITE_PATH
+from utils.storage_backend import BackendSingleton, FirestoreBackend
+
+# Firestore caps a write batch at 500 operations
+_FIRESTORE_BATCH_SIZE = 500
+
+# Number of rows read from SQLite at a time while iterating
+_SQLITE_PAGE_SIZE = 1000
+
+
+def to_message_record(channel_id: str, message: dict) -> MessageRecord:
+    """Keeps only the fields of a Slack message that the reports use."""
+    return MessageRecord(
+        channel_id=channel_id,
+        ts=message["ts"],
+        user=message.get("user"),
+        text=message.get("text", ""),
+        subtype=message.get("subtype"),
+    )
+
+
+class MessageStore(ABC):
+    """Persists Slack messages per channel together with how far each channel has been synced.
+
+    The sync state of a channel is a `(synced_from, high_water_mark)` pair: every
+    message posted after `synced_from` and up to `high_water_mark` (the `ts` of the
+    newest message seen) is already stored, so only messages newer than the high
+    water mark need to be requested from Slack.
+    """
+
+    @abstractmethod
+    def get_sync_state(self, channel_id: str) -> tuple[float, float] | None:
+        ...
+
+    @abstractmethod
+    def set_sync_state(self, channel_id: str, synced_from: float, high_water_mark: float) -> None:
+        """Records how far a channel is synced. Only call this once its messages are saved."""
+
+    @abstractmethod
+    def save_messages(self, channel_id: str, messages: list[MessageRecord]) -> None:
+        ...
+
+    @abstractmethod
+    def iter_messages(self, channel_id: str, oldest: float) -> Iterator[MessageRecord]:
+        """Yields the stored messages of a channel newer than `oldest`, newest first."""
+
+    @abstractmethod
+    def iter_user_messages(self, user_id: str, oldest: float) -> Iterator[MessageRecord]:
+        """Yields the stored messages of a user in any channel newer than `oldest`, newest first.
+
+        Messages are indexed by user as they are stored, so this only reads that
+        user's messages.
+        """
+
+
+class SQLiteMessageStore(MessageStore):
+    """Local stand-in for the Firestore store, for local runs and the Functions emulator (MESSAGE_STORE_BACKEND=sqlite)."""
+
+    def __init__(self, path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS channel_sync ("
+                "channel_id TEXT PRIMARY KEY, synced_from REAL, high_water_mark REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "channel_id TEXT, ts TEXT, ts_float REAL, user TEXT, text TEXT, subtype TEXT, "
+                "PRIMARY KEY (channel_id, ts))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS messages_by_user ON messages (user, ts_float)"
+            )
+
+    def get_sync_state(self, channel_id: str) -> tuple[float, float] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_from, high_water_mark FROM channel_sync WHERE channel_id = ?",
+                (channel_id,),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set_sync_state(self, channel_id: str, synced_from: float, high_water_mark: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO channel_sync VALUES (?, ?, ?)",
+                (channel_id, synced_from, high_water_mark),
+            )
+
+    def save_messages(self, channel_id: str, messages: list[MessageRecord]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (channel_id, msg.ts, float(msg.ts), msg.user, msg.text, msg.subtype)
+                    for msg in messages
+                ],
+            )
+
+    def _iter_rows(self, column: str, value: str, oldest: float) -> Iterator[MessageRecord]:
+        # Keyset pagination, so the lock is never held while the caller consumes a page
+        last_key = (float("inf"), "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT channel_id, ts, ts_float, user, text, subtype FROM messages "
+                    f"WHERE {column} = ? AND ts_float > ? "
+                    "AND (ts_float < ? OR (ts_float = ? AND channel_id < ?)) "
+                    "ORDER BY ts_float DESC, channel_id DESC LIMIT ?",
+                    (value, oldest, last_key[0], last_key[0], last_key[1], _SQLITE_PAGE_SIZE),
+                ).fetchall()
+            for channel_id, ts, _, user, text, subtype in rows:
+                yield MessageRecord(channel_id, ts, user, text, subtype)
+            if len(rows) < _SQLITE_PAGE_SIZE:
+                return
+            last_key = (rows[-1][2], rows[-1][0])
+
+    def iter_messages(self, channel_id: str, oldest: float) -> Iterator[MessageRecord]:
+        return self._iter_rows("channel_id", channel_id, oldest)
+
+    def iter_user_messages(self, user_id: str, oldest: float) -> Iterator[MessageRecord]:
+        return self._iter_rows("user", user_id, oldest)
+
+
+class FirestoreMessageStore(FirestoreBackend, MessageStore):
+    """Stores messages under `slack_channels/{channel_id}/messages/{ts}`."""
+
+    def __init__(self, collection: str = "slack_channels"):
+        super().__init__(collection)
+
+    def get_sync_state(self, channel_id: str) -> tuple[float, float] | None:
+        snapshot = self._collection.document(channel_id).get()
+        if not snapshot.exists:
+            return None
+        data = snapshot.to_dict()
+        return data["synced_from"], data["high_water_mark"]
+
+    def set_sync_state(self, channel_id: str, synced_from: float, high_water_mark: float) -> None:
+        self._collection.document(channel_id).set(
+            {"synced_from": synced_from, "high_water_mark": high_water_mark}
+        )
+
+    def save_messages(self, channel_id: str, messages: list[MessageRecord]) -> None:
+        messages_ref = self._collection.document(channel_id).collection("messages")
+        for start in range(0, len(messages), _FIRESTORE_BATCH_SIZE):
+            batch = self._client.batch()
+            for msg in messages[start:start + _FIRESTORE_BATCH_SIZE]:
+                batch.set(messages_ref.document(msg.ts), {
+                    "ts": msg.ts,
+                    "ts_float": float(msg.ts),
+                    "user": msg.user,
+                    "text": msg.text,
+                    "subtype": msg.subtype,
+                })
+            batch.commit()
+
+    @staticmethod
+    def _iter_query(query) -> Iterator[MessageRecord]:
+        # stream() fetches results lazily, so only a page is held at a time
+        for snapshot in query.stream():
+            data = snapshot.to_dict()
+            yield MessageRecord(
+                channel_id=snapshot.reference.parent.parent.id,
+                ts=data["ts"],
+                user=data.get("user"),
+                text=data.get("text", ""),
+                subtype=data.get("subtype"),
+            )
+
+    def iter_messages(self, channel_id: str, oldest: float) -> Iterator[MessageRecord]:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        from firebase_admin import firestore
+
+        return self._iter_query(
+            self._collection.document(channel_id)
+            .collection("messages")
+            .where(filter=FieldFilter("ts_float", ">", oldest))
+            .order_by("ts_float", direction=firestore.Query.DESCENDING)
+        )
+
+    def iter_user_messages(self, user_id: str, oldest: float) -> Iterator[MessageRecord]:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        from firebase_admin import firestore
+
+        # Served by the (user, ts_float) collection group index in firestore.indexes.json
+        return self._iter_query(
+            self._client.collection_group("messages")
+            .where(filter=FieldFilter("user", "==", user_id))
+            .where(filter=FieldFilter("ts_float", ">", oldest))
+            .order_by("ts_float", direction=firestore.Query.DESCENDING)
+        )
+
+
+_store = BackendSingleton(
+    MESSAGE_STORE_BACKEND, lambda: SQLiteMessageStore(MESSAGE_STORE_SQLITE_PATH), FirestoreMessageStore
+)
+
+
+def get_message_store() -> MessageStore:
+    """Returns the process-wide message store selected by MESSAGE_STORE_BACKEND."""
+    return _store.get()
@@ -0,0 +1,125 @@
+import sys
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+
+from model.message import MessageRecord
+
+
+class MessageWindow:
+    """Columnar, time-sorted store for a large window of Slack messages.
+
+    Timestamps are kept in a float64 array, and users, channels and subtypes
+    are interned into small integer code arrays, so a message costs a few bytes
+    of fixed overhead plus its text. Time-range slices are views found with a
+    binary search, and grouping by user or channel is a single stable argsort.
+    """
+
+    def __init__(
+        self,
+        ts: np.ndarray,
+        user_codes: np.ndarray,
+        channel_codes: np.ndarray,
+        subtype_codes: np.ndarray,
+        texts: list[str],
+        users: list[str | None],
+        channels: list[str],
+        subtypes: list[str | None],
+    ):
+        self.ts = ts
+        self.user_codes = user_codes
+        self.channel_codes = channel_codes
+        self.subtype_codes = subtype_codes
+        self.texts = texts
+        # Code -> value tables shared by every window derived from this one
+        self.users = users
+        self.channels = channels
+        self.subtypes = subtypes
+
+    @classmethod
+    def from_records(cls, records: Iterable[MessageRecord]) -> "MessageWindow":
+        """Builds a window from message records in any order, consuming them lazily."""
+        interned: tuple[dict, dict, dict] = ({}, {}, {})
+        ts, user_codes, channel_codes, subtype_codes, texts = [], [], [], [], []
+        for record in records:
+            ts.append(float(record.ts))
+            user_codes.append(interned[0].setdefault(record.user, len(interned[0])))
+            channel_codes.append(interned[1].setdefault(record.channel_id, len(interned[1])))
+            subtype_codes.append(interned[2].setdefault(record.subtype, len(interned[2])))
+            texts.append(sys.intern(record.text) if len(record.text) < 16 else record.text)
+
+        order = np.argsort(np.asarray(ts, dtype=np.float64), kind="stable")
+        return cls(
+            ts=np.asarray(ts, dtype=np.float64)[order],
+            user_codes=np.asarray(user_codes, dtype=np.int32)[order],
+            channel_codes=np.asarray(channel_codes, dtype=np.int32)[order],
+            subtype_codes=np.asarray(subtype_codes, dtype=np.int16)[order],
+            texts=[texts[i] for i in order],
+            users=list(interned[0]),
+            channels=list(interned[1]),
+            subtypes=list(interned[2]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def _take(self, indices: np.ndarray | slice) -> "MessageWindow":
+        texts = self.texts[indices] if isinstance(indices, slice) else [self.texts[i] for i in indices]
+        return MessageWindow(
+            self.ts[indices],
+            self.user_codes[indices],
+            self.channel_codes[indices],
+            self.subtype_codes[indices],
+            texts,
+            self.users,
+            self.channels,
+            self.subtypes,
+        )
+
+    def take(self, indices: np.ndarray) -> "MessageWindow":
+        """Returns the messages at the given positions, which must be in ascending order to stay time-sorted."""
+        return self._take(indices)
+
+    def slice_time(self, start: float, end: float = float("inf")) -> "MessageWindow":
+        """Returns the messages with `start < ts <= end`, like Slack's oldest/latest."""
+        lo, hi = np.searchsorted(self.ts, [start, end], side="right")
+        return self._take(slice(lo, hi))
+
+    def _group_by(self, codes: np.ndarray, values: list) -> dict:
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+        groups = {}
+        for group in np.split(order, boundaries):
+            if len(group):
+                groups[values[codes[group[0]]]] = self._take(group)
+        return groups
+
+    def group_by_user(self) -> dict[str | None, "MessageWindow"]:
+        """Splits the window per user, keeping each group in time order."""
+        return self._group_by(self.user_codes, self.users)
+
+    def group_by_channel(self) -> dict[str, "MessageWindow"]:
+        """Splits the window per channel, keeping each group in time order."""
+        return self._group_by(self.channel_codes, self.channels)
+
+    def bucket_by_time(self, origin: float, bucket_seconds: float) -> dict[int, "MessageWindow"]:
+        """Splits the window into fixed-size time buckets numbered from `origin`."""
+        buckets = np.floor((self.ts - origin) / bucket_seconds).astype(np.int64)
+        boundaries = np.flatnonzero(np.diff(buckets)) + 1
+        return {
+            int(buckets[start]): self._take(slice(start, end))
+            for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(self)])
+            if end > start
+        }
+
+    def records(self) -> Iterator[MessageRecord]:
+        """Yields the messages as records, oldest first."""
+        for i in range(len(self)):
+            yield MessageRecord(
+                channel_id=self.channels[self.channel_codes[i]],
+                ts=f"{self.ts[i]:.6f}",
+                user=self.users[self.user_codes[i]],
+                text=self.texts[i],
+                subtype=self.subtypes[self.subtype_codes[i]],
+            )
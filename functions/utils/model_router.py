@@ -0,0 +1,153 @@
+import bisect
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TypeVar
+
+from utils.token_utils import Preflight, preflight
+
+T = TypeVar("T")
+
+# Hedged requests run here so the caller can wait on the first answer from either copy
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+class LatencyHistogram:
+    """Counts call latencies in logarithmic buckets from 50 ms to about 10 minutes, each 25% wider than the last."""
+
+    BOUNDS = [0.05 * 1.25 ** i for i in range(43)]
+
+    def __init__(self):
+        self._counts = [0] * (len(self.BOUNDS) + 1)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+            self._total += 1
+
+    def __len__(self) -> int:
+        return self._total
+
+    def percentile(self, percent: float) -> float | None:
+        """Returns the upper bound of the bucket holding the given percentile, or None without samples."""
+        with self._lock:
+            if not self._total:
+                return None
+            rank = percent / 100 * self._total
+            seen = 0
+            for index, count in enumerate(self._counts):
+                seen += count
+                if seen >= rank and count:
+                    return self.BOUNDS[min(index, len(self.BOUNDS) - 1)]
+        return self.BOUNDS[-1]
+
+
+class ModelRouter:
+    """Picks a model per request by prompt size, and hedges slow requests.
+
+    Prompts of up to `small_model_max_input_tokens` tokens go to the faster
+    `small_model`; larger ones go to `large_model`. Latencies are recorded in a
+    histogram per model. When `hedge_percentile` is set and a model has at least
+    `min_hedge_samples` samples, a request still running after that percentile of
+    the model's latency is sent a second time and the first answer wins.
+    """
+
+    def __init__(
+        self,
+        large_model: str,
+        small_model: str | None,
+        small_model_max_input_tokens: int,
+        hedge_percentile: float,
+        min_hedge_samples: int = 20,
+    ):
+        self.large_model = large_model
+        self.small_model = small_model
+        self.small_model_max_input_tokens = small_model_max_input_tokens
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_samples = min_hedge_samples
+        self._histograms: dict[str, LatencyHistogram] = {}
+        self._hedged = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache_tag(self) -> str:
+        """Identifies the routing setup in cache keys, since it decides which model wrote an answer."""
+        if not self.small_model:
+            return self.large_model
+        return f"{self.large_model}+{self.small_model}@{self.small_model_max_input_tokens}"
+
+    def route(self, prompt_parts: list[str], max_tokens: int, min_output_tokens: int = 256) -> tuple[str, Preflight]:
+        """Returns the model for a prompt and the prompt's preflight check against that model.
+
+        The prompt only fits a model that leaves room for at least `min_output_tokens` of answer.
+        """
+        if self.small_model:
+            check = preflight(self.small_model, prompt_parts, max_tokens, min_output_tokens)
+            if check.input_tokens <= self.small_model_max_input_tokens and check.fits:
+                return self.small_model, check
+        return self.large_model, preflight(self.large_model, prompt_parts, max_tokens, min_output_tokens)
+
+    def _histogram(self, model: str) -> LatencyHistogram:
+        with self._lock:
+            return self._histograms.setdefault(model, LatencyHistogram())
+
+    def record(self, model: str, seconds: float) -> None:
+        self._histogram(model).record(seconds)
+
+    def call(self, model: str, send: Callable[[], T]) -> T:
+        """Runs `send()` for `model`, recording its latency and hedging it if it is slow."""
+        def timed() -> T:
+            start = time.monotonic()
+            result = send()
+            self.record(model, time.monotonic() - start)
+            return result
+
+        histogram = self._histogram(model)
+        if not self.hedge_percentile or len(histogram) < self.min_hedge_samples:
+            return timed()
+
+        hedge_after = histogram.percentile(self.hedge_percentile)
+        sent = threading.Event()
+
+        def first() -> T:
+            sent.set()
+            return timed()
+
+        futures = [_hedge_executor.submit(first)]
+        # Time the request from when it is sent, not from when it was queued behind other requests
+        sent.wait()
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            print(f"{model} request slower than p{self.hedge_percentile:g} ({hedge_after:.1f}s), sending a hedged request")
+            with self._lock:
+                self._hedged += 1
+            futures.append(_hedge_executor.submit(timed))
+
+        # Return the first successful answer; the other request finishes in the background
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> dict:
+        """Returns the number of samples and the p50/p95/p99 latency of each model, and how many requests were hedged."""
+        with self._lock:
+            histograms = dict(self._histograms)
+            hedged = self._hedged
+        return {
+            "hedged_requests": hedged,
+            "models": {
+                model: {
+                    "calls": len(histogram),
+                    **{f"p{p}": histogram.percentile(p) for p in (50, 95, 99)},
+                }
+                for model, histogram in histograms.items()
+            },
+        }
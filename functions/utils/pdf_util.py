@@ -1,37 +1,609 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-
-def create_pdf_with_text(text, file_path, max_chars_per_line=80):
-    """Create a multi-page PDF file with the specified text."""
-    c = canvas.Canvas(file_path, pagesize=letter)
-    width, height = letter
-    c.setFont("Helvetica", 12)
-
-    # Set starting position and page parameters
-    margin = 40
-    line_height = 14  # Adjust based on font size
-    max_lines_per_page = int((height - 2 * margin) / line_height)
-
-    # Split text into lines and further split long lines by character limit
-    text_lines = []
-    for line in text.splitlines():
-        # Split line into chunks if it exceeds max_chars_per_line
-        while len(line) > max_chars_per_line:
-            text_lines.append(line[:max_chars_per_line])
-            line = line[max_chars_per_line:]
-        text_lines.append(line)
-
-    # Loop through lines and add to PDF, page by page
-    line_count = 0
-    for line in text_lines:
-        if line_count >= max_lines_per_page:
-            c.showPage()  # Start a new page
-            c.setFont("Helvetica", 12)
-            line_count = 0  # Reset line count for new page
-
-        # Draw the line on the current page
-        c.drawString(margin, height - margin - (line_count * line_height), line)
-        line_count += 1
-
-    # Save the PDF
-    c.save()
\ No newline at end of file
+import itertools
+import os
+import re
+import threading
+import zlib
+from collections.abc import Iterable
+from dataclasses import dataclass
+from functools import lru_cache
+
+# reportlab only supplies font metrics and TrueType parsing and subsetting here.
+# TTFontFace.makeSubset is undocumented, which is one reason reportlab is pinned
+# in requirements.txt; tests/test_pdf_util.py reads the fonts back with pypdf
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.lib.rl_accel import fp_str
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import FF_NONSYMBOLIC, FF_SYMBOLIC, TTFError, TTFont
+
+from utils.configs import PDF_FONT_DIR, PDF_SCRIPT_FONTS
+
+# Line boundaries recognized by str.splitlines
+_LINE_BREAK = re.compile(r"\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+# Words whose widths are remembered per font before the memo is cleared
+_WORD_WIDTH_MEMO_SIZE = 10_000
+# Only words up to this many characters are remembered; longer ones (URLs, unspaced CJK paragraphs) rarely repeat
+_WORD_WIDTH_MEMO_MAX_LENGTH = 32
+
+# Built-in Japanese font, used when no Japanese TrueType font is installed; viewers and printers supply its glyphs
+JAPANESE_CID_FONT = "HeiseiKakuGo-W5"
+# Its font dictionary, as in reportlab's font data; the widths cover the proportional Latin characters
+_JAPANESE_CID_FONT_DICT = {
+    "Type": "/Font",
+    "Subtype": "/Type0",
+    "BaseFont": "/HeiseiKakuGo-W5",
+    "DescendantFonts": [{
+        "Type": "/Font",
+        "Subtype": "/CIDFontType0",
+        "BaseFont": "/HeiseiKakuGo-W5",
+        "FontDescriptor": {
+            "Type": "/FontDescriptor",
+            "Ascent": 752,
+            "CapHeight": 737,
+            "Descent": -221,
+            "Flags": 4,
+            "FontBBox": [-92, -250, 1010, 922],
+            "FontName": "/HeiseiKakuGo-W5",
+            "ItalicAngle": 0,
+            "StemH": 0,
+            "StemV": 114,
+            "XHeight": 553,
+        },
+        "CIDSystemInfo": {"Registry": "(Adobe)", "Ordering": "(Japan1)", "Supplement": 2},
+        "DW": 1000,
+        "W": (
+            1, (277, 305, 500, 668, 668, 906, 727, 305, 445, 445, 508, 668, 305, 379, 305, 539),
+            17, 26, 668,
+            27, (305, 305, 668, 668, 668, 566, 871, 727, 637, 652, 699, 574, 555, 676, 687, 242, 492, 664, 582, 789,
+                 707, 734, 582, 734, 605, 605, 641, 668, 727, 945, 609, 609, 574, 445, 668, 445, 668, 668, 590, 555,
+                 609, 547, 602, 574, 391, 609, 582, 234, 277, 539, 234, 895, 582, 605, 602, 602, 387, 508, 441, 582,
+                 562, 781, 531, 570, 555, 449, 246, 449, 668),
+            231, 632, 500,
+        ),
+    }],
+}
+# A character each script's font must have to be used for that script
+_SCRIPT_SAMPLES = {"cyrillic": "Ж", "devanagari": "क", "japanese": "あ"}
+
+# Font subsets already built, by font and characters; built one at a time since font files are read statefully
+_FONT_SUBSET_MEMO_SIZE = 64
+_font_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class PageLayout:
+    """How text is set on each printed sheet: in `columns` x `rows` logical pages, at one font size."""
+
+    name: str
+    columns: int
+    rows: int
+    landscape: bool
+    font_size: float
+    line_height: float
+    margin: float  # Around the sheet
+    gutter: float  # Between logical pages
+    two_sided: str  # Epson Connect "2_sided" print setting: "none", "long" or "short"
+
+    @property
+    def pages_per_sheet(self) -> int:
+        return self.columns * self.rows
+
+
+# Compact layouts set text in about the size a printer's own N-up scaling would, with narrower margins
+LAYOUTS = {
+    "1up": PageLayout("1up", 1, 1, False, font_size=12, line_height=14, margin=40, gutter=0, two_sided="none"),
+    # Side by side on a landscape sheet, so the back side flips on the short edge
+    "2up": PageLayout("2up", 2, 1, True, font_size=8.5, line_height=9.8, margin=28, gutter=24, two_sided="short"),
+    "4up": PageLayout("4up", 2, 2, False, font_size=6, line_height=7, margin=24, gutter=18, two_sided="long"),
+}
+
+
+def get_layout(name: str) -> PageLayout:
+    """Returns the layout of a `layout:` slash command option."""
+    try:
+        return LAYOUTS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown layout '{name}'. Use one of: {', '.join(LAYOUTS)}.") from None
+
+
+class GlyphWidths(dict):
+    """Width in points of every character of a font at one size.
+
+    The 256 characters of the font's single-byte encoding are read from the
+    font's width table up front; any other character is measured once on first
+    use. TrueType and CID fonts are measured character by character.
+    """
+
+    def __init__(self, font_name: str, font_size: float):
+        super().__init__()
+        self.font_name = font_name
+        self.font_size = font_size
+        font = pdfmetrics.getFont(font_name)
+        scale = font_size / 1000
+        encoding = getattr(font, "encName", None)
+        if encoding == "WinAnsiEncoding" and len(getattr(font, "widths", ())) == 256:
+            for code, width in enumerate(font.widths):
+                try:
+                    self[bytes([code]).decode("cp1252")] = width * scale
+                except UnicodeDecodeError:
+                    pass
+        self._words: dict[str, float] = {}
+        self._split_words: dict[tuple[str, float], tuple[list[str], str, float]] = {}
+        # Widest character of the font, so short lines can skip measuring
+        if isinstance(font, TTFont):
+            self.max_width = max(font.face.defaultWidth, *font.face.charWidths.values()) * scale
+        elif isinstance(font, UnicodeCIDFont):
+            self.max_width = max(1000, *font.unicodeWidths.values()) * scale
+        else:
+            self.max_width = max(self.values(), default=font_size)
+
+    def __missing__(self, char: str) -> float:
+        width = pdfmetrics.stringWidth(char, self.font_name, self.font_size)
+        self[char] = width
+        self.max_width = max(self.max_width, width)
+        return width
+
+    def word_width(self, word: str) -> float:
+        if len(word) > _WORD_WIDTH_MEMO_MAX_LENGTH:
+            return sum(map(self.__getitem__, word))
+        width = self._words.get(word)
+        if width is None:
+            if len(self._words) >= _WORD_WIDTH_MEMO_SIZE:
+                self._words.clear()
+            width = self._words[word] = sum(map(self.__getitem__, word))
+        return width
+
+    def split_word(self, word: str, max_width: float) -> tuple[list[str], str, float]:
+        """Breaks a word wider than `max_width` into full-line pieces plus the remainder and its width."""
+        if len(word) > _WORD_WIDTH_MEMO_MAX_LENGTH:
+            return self._split(word, max_width)
+        key = (word, max_width)
+        if key not in self._split_words:
+            if len(self._split_words) >= _WORD_WIDTH_MEMO_SIZE:
+                self._split_words.clear()
+            self._split_words[key] = self._split(word, max_width)
+        return self._split_words[key]
+
+    def _split(self, word: str, max_width: float) -> tuple[list[str], str, float]:
+        pieces, piece, piece_width = [], "", 0.0
+        for char in word:
+            if piece and piece_width + self[char] > max_width:
+                pieces.append(piece)
+                piece, piece_width = "", 0.0
+            piece += char
+            piece_width += self[char]
+        return pieces, piece, piece_width
+
+
+@lru_cache(maxsize=None)
+def glyph_widths(font_name: str, font_size: float) -> GlyphWidths:
+    """Returns the memoized glyph width table of a font at a size."""
+    return GlyphWidths(font_name, font_size)
+
+
+@lru_cache(maxsize=None)
+def _load_script_font(script: str) -> str:
+    file_name = PDF_SCRIPT_FONTS.get(script)
+    if file_name:
+        path = os.path.join(PDF_FONT_DIR, file_name)
+        try:
+            font = TTFont(f"{script}-{os.path.splitext(file_name)[0]}", path)
+            if ord(_SCRIPT_SAMPLES.get(script, "A")) in font.face.charToGlyph:
+                pdfmetrics.registerFont(font)
+                print(f"Registered {path} for {script} text")
+                return font.fontName
+            print(f"{path} has no {script} glyphs, falling back to a built-in font")
+        except (OSError, TTFError) as e:
+            print(f"Could not load the {script} font {path}, falling back to a built-in font: {e}")
+
+    if script == "japanese":
+        pdfmetrics.registerFont(UnicodeCIDFont(JAPANESE_CID_FONT))
+        return JAPANESE_CID_FONT
+    if script != "latin":
+        print(f"No {script} font is installed, {script} text will print as '?'; add {file_name} to {PDF_FONT_DIR}")
+    return "Helvetica"
+
+
+def script_font(script: str) -> str:
+    """Returns the name of the font to set text of a script in ("latin", "cyrillic", "devanagari" or "japanese").
+
+    The script's TrueType font from PDF_FONT_DIR is parsed and registered once
+    per instance and reused afterwards.
+    """
+    with _font_lock:
+        return _load_script_font(script)
+
+
+def script_font_warning(script: str) -> str | None:
+    """Returns a note for the user on how text of `script` prints with the installed fonts, or None if it prints as written."""
+    if script != "latin" and script_font(script) == "Helvetica":
+        return f'no {script} font is installed, so its characters print as "?"'
+    if script == "devanagari":
+        # Glyphs are placed one per character, without the font's shaping rules
+        return "Devanagari is printed unshaped, so conjuncts and vowel signs may not join"
+    return None
+
+
+@lru_cache(maxsize=_FONT_SUBSET_MEMO_SIZE)
+def _font_subset(font: TTFont, code_points: tuple[int, ...]) -> bytes:
+    with _font_lock:
+        return font.face.makeSubset(list(code_points))
+
+
+def wrap_paragraph(paragraph: str, widths: GlyphWidths, max_width: float) -> list[str]:
+    """Word-wraps one line of text to `max_width` points, breaking words only when they are wider than a line."""
+    # Most lines are short enough to fit whatever their characters are
+    if len(paragraph) * widths.max_width <= max_width:
+        return [paragraph]
+
+    space = widths[" "]
+    lines, current, current_width = [], [], 0.0
+    for word in paragraph.split(" "):
+        word_width = widths.word_width(word)
+        if current and current_width + space + word_width > max_width:
+            lines.append(" ".join(current))
+            current, current_width = [], 0.0
+        if word_width > max_width:
+            # An overlong word (e.g. a URL) always starts a line, so its pieces depend only on the word
+            pieces, word, word_width = widths.split_word(word, max_width)
+            lines.extend(pieces)
+        current_width += word_width + (space if current else 0.0)
+        current.append(word)
+    lines.append(" ".join(current))
+    return lines
+
+
+def _pdf_string(data: bytes) -> bytes:
+    """Escapes bytes for a PDF literal string."""
+    for char, escaped in ((b"\\", b"\\\\"), (b"(", b"\\("), (b")", b"\\)"), (b"\r", b"\\r"), (b"\n", b"\\n")):
+        data = data.replace(char, escaped)
+    return b"(" + data + b")"
+
+
+def _subset_tag(number: int) -> str:
+    """Six capital letters that prefix the name of a font subset, as the PDF spec requires."""
+    return f"{number:06d}".translate(str.maketrans("0123456789", "ABCDEFGIJK"))
+
+
+def _pdf_value(value) -> bytes:
+    """Serializes a font description; strings are already PDF names or strings, and bytes are written as they are."""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, dict):
+        return b"<< " + b" ".join(b"/%s %s" % (key.encode(), _pdf_value(item)) for key, item in value.items()) + b" >>"
+    if isinstance(value, (list, tuple)):
+        return b"[" + b" ".join(map(_pdf_value, value)) + b"]"
+    if isinstance(value, str):
+        return value.encode("latin-1")
+    return fp_str(value).encode()
+
+
+class PdfStreamWriter:
+    """Writes a PDF to a binary file one page at a time.
+
+    Each page's content stream is compressed and written out as soon as the
+    page is added; only the byte offsets of the objects written so far are kept,
+    so the writer's memory stays flat however many pages the document has. The
+    page tree is written when the document is closed. Written to a file on disk,
+    the whole PDF stays flat; written to `io.BytesIO`, the compressed output
+    (about 0.6 KB per full page of text) is held in memory instead.
+    """
+
+    def __init__(self, file, page_size=letter):
+        self._file = file
+        self._page_size = page_size
+        self._position = 0
+        self._offsets: list[int | None] = []  # Byte offset of object n at index n - 1
+        self._page_ids: list[int] = []
+        self._fonts: dict[str, int] = {}  # Resource name to font object
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        # The catalog and page tree are written last, under numbers reserved up front
+        self._catalog_id = self.reserve_object()
+        self._pages_id = self.reserve_object()
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._position += len(data)
+
+    def reserve_object(self) -> int:
+        """Returns the number of an object that is written later, so it can be referred to before then."""
+        self._offsets.append(None)
+        return len(self._offsets)
+
+    def add_object(self, body: bytes, object_id: int | None = None) -> int:
+        object_id = object_id or self.reserve_object()
+        self._offsets[object_id - 1] = self._position
+        self._write(b"%d 0 obj\n%s\nendobj\n" % (object_id, body))
+        return object_id
+
+    def add_stream(self, data: bytes, entries: bytes = b"") -> int:
+        """Compresses and writes a stream object with optional extra dictionary entries."""
+        data = zlib.compress(data)
+        return self.add_object(
+            b"<< /Length %d /Filter /FlateDecode %s>>\nstream\n%s\nendstream" % (len(data), entries, data)
+        )
+
+    def add_font(self, object_id: int) -> str:
+        """Makes a font object available to every page and returns its resource name."""
+        resource = f"F{len(self._fonts) + 1}"
+        self._fonts[resource] = object_id
+        return resource
+
+    def add_page(self, content: bytes):
+        """Compresses a page's content stream and writes the page out."""
+        stream_id = self.add_stream(content)
+        self._page_ids.append(
+            self.add_object(b"<< /Type /Page /Parent %d 0 R /Contents %d 0 R >>" % (self._pages_id, stream_id))
+        )
+
+    def close(self):
+        # A PDF needs at least one page
+        if not self._page_ids:
+            self.add_page(b"")
+
+        # Pages inherit the page size and fonts from the page tree
+        fonts = b" ".join(b"/%s %d 0 R" % (name.encode(), object_id) for name, object_id in self._fonts.items())
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self._page_ids)
+        self.add_object(
+            b"<< /Type /Pages /Kids [%s] /Count %d /MediaBox [0 0 %s] /Resources << /Font << %s >> >> >>"
+            % (kids, len(self._page_ids), fp_str(*self._page_size).encode(), fonts),
+            self._pages_id,
+        )
+        self.add_object(b"<< /Type /Catalog /Pages %d 0 R >>" % self._pages_id, self._catalog_id)
+
+        xref_position = self._position
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self._offsets) + 1))
+        self._write(b"".join(b"%010d 00000 n \n" % offset for offset in self._offsets))
+        self._write(
+            b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(self._offsets) + 1, self._catalog_id, xref_position)
+        )
+
+
+class _StandardFont:
+    """One of the 14 standard PDF fonts in WinAnsi encoding; characters outside it print as "?"."""
+
+    def __init__(self, pdf: PdfStreamWriter, font_name: str):
+        self._resource = pdf.add_font(
+            pdf.add_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % font_name.encode())
+        )
+
+    def encode(self, text: str) -> list[tuple[str, bytes]]:
+        """Returns the font resource and PDF string of each run of `text`."""
+        return [(self._resource, _pdf_string(text.encode("cp1252", "replace")))]
+
+    def close(self):
+        pass
+
+
+class _CIDFont:
+    """A built-in CID font, which is not embedded; text is encoded as UTF-16."""
+
+    def __init__(self, pdf: PdfStreamWriter, font_name: str):
+        description = dict(_JAPANESE_CID_FONT_DICT, Encoding="/" + pdfmetrics.getFont(font_name).encodingName)
+        self._resource = pdf.add_font(pdf.add_object(_pdf_value(description)))
+
+    def encode(self, text: str) -> list[tuple[str, bytes]]:
+        return [(self._resource, b"<%s>" % text.encode("utf-16-be").hex().encode())]
+
+    def close(self):
+        pass
+
+
+def _to_unicode_cmap(font_name: str, subset: list[int]) -> bytes:
+    """Maps the one-byte codes of a font subset back to their characters, so text can be copied and searched.
+
+    Characters outside the Basic Multilingual Plane are written as UTF-16
+    surrogate pairs, and the mappings are split into blocks of at most 100 as
+    the PDF reference requires. Code 0, the missing-character glyph, is left out.
+    """
+    mappings = [
+        b"<%02X> <%s>" % (code, char.encode("utf-16-be").hex().upper().encode())
+        for code, char in enumerate(map(chr, subset))
+        if code
+    ]
+    blocks = []
+    for start in range(0, len(mappings), 100):
+        block = mappings[start:start + 100]
+        blocks.append(b"%d beginbfchar\n%s\nendbfchar" % (len(block), b"\n".join(block)))
+    name = font_name.encode("latin-1")
+    return b"\n".join([
+        b"/CIDInit /ProcSet findresource begin",
+        b"12 dict begin",
+        b"begincmap",
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+        b"/CMapName /%s-UCS def" % name,
+        b"/CMapType 2 def",
+        b"1 begincodespacerange",
+        b"<00> <FF>",
+        b"endcodespacerange",
+        *blocks,
+        b"endcmap",
+        b"CMapName currentdict /CMap defineresource pop",
+        b"end",
+        b"end",
+    ])
+
+
+class _TrueTypeFont:
+    """Embeds the characters of a TrueType font a document uses, in subsets of up to 256 characters.
+
+    As in reportlab, every subset is a separate PDF font whose character codes
+    are the positions of the characters in the subset. The subsets are built
+    and written when the document is closed.
+    """
+
+    def __init__(self, pdf: PdfStreamWriter, font_name: str):
+        self._pdf = pdf
+        self._font = pdfmetrics.getFont(font_name)
+        self._codes: dict[str, tuple[int, int]] = {}  # Character to subset number and code
+        self._subsets: list[list[int]] = []
+        self._font_ids: list[int] = []
+        self._resources: list[str] = []
+
+    def _code(self, char: str) -> tuple[int, int]:
+        code = self._codes.get(char)
+        if code is None:
+            if not self._subsets or len(self._subsets[-1]) == 256:
+                # Code 0 of every subset is the font's missing-character glyph
+                self._subsets.append([0])
+                self._font_ids.append(self._pdf.reserve_object())
+                self._resources.append(self._pdf.add_font(self._font_ids[-1]))
+            subset = self._subsets[-1]
+            code = self._codes[char] = (len(self._subsets) - 1, len(subset))
+            subset.append(ord(char))
+        return code
+
+    def encode(self, text: str) -> list[tuple[str, bytes]]:
+        return [
+            (self._resources[subset], b"<%s>" % bytes(code for _, code in codes).hex().encode())
+            for subset, codes in itertools.groupby(map(self._code, text), key=lambda code: code[0])
+        ]
+
+    def close(self):
+        face = self._font.face
+        for number, (subset, font_id) in enumerate(zip(self._subsets, self._font_ids)):
+            base_font = _subset_tag(number) + "+" + (face.name + face.subfontNameX).decode("latin-1")
+            font_file = _font_subset(self._font, tuple(subset))
+            font_file_id = self._pdf.add_stream(font_file, b"/Length1 %d " % len(font_file))
+            descriptor_id = self._pdf.add_object(_pdf_value({
+                "Type": "/FontDescriptor",
+                "FontName": "/" + base_font,
+                "Ascent": face.ascent,
+                "CapHeight": face.capHeight,
+                "Descent": face.descent,
+                "Flags": face.flags & ~FF_NONSYMBOLIC | FF_SYMBOLIC,
+                "FontBBox": face.bbox,
+                "ItalicAngle": face.italicAngle,
+                "StemV": face.stemV,
+                "MissingWidth": face.defaultWidth,
+                "FontFile2": b"%d 0 R" % font_file_id,
+            }))
+            to_unicode_id = self._pdf.add_stream(_to_unicode_cmap(base_font, subset))
+            self._pdf.add_object(
+                _pdf_value({
+                    "Type": "/Font",
+                    "Subtype": "/TrueType",
+                    "BaseFont": "/" + base_font,
+                    "FirstChar": 0,
+                    "LastChar": len(subset) - 1,
+                    "Widths": [face.getCharWidth(code) for code in subset],
+                    "ToUnicode": b"%d 0 R" % to_unicode_id,
+                    "FontDescriptor": b"%d 0 R" % descriptor_id,
+                }),
+                font_id,
+            )
+
+
+def _pdf_font(pdf: PdfStreamWriter, font_name: str):
+    font = pdfmetrics.getFont(font_name)
+    if isinstance(font, TTFont):
+        return _TrueTypeFont(pdf, font_name)
+    if isinstance(font, UnicodeCIDFont):
+        return _CIDFont(pdf, font_name)
+    return _StandardFont(pdf, font_name)
+
+
+class PdfTextWriter:
+    """Lays out text into a multi-page PDF line by line, writing each sheet out as soon as it is full.
+
+    Lines are word-wrapped to the page width using the font's glyph widths, and
+    each page is drawn as a single text object. With a compact `layout`,
+    several logical pages are set side by side on every sheet. Text can be
+    written while it is still being generated (e.g. as translated sections
+    arrive), and only the current sheet is held in memory, so memory does not
+    grow with the length of the text. `file_path` is a path or a binary file
+    object such as `io.BytesIO`, which holds the compressed output instead.
+    """
+
+    def __init__(self, file_path, font_name="Helvetica", layout: PageLayout = LAYOUTS["1up"]):
+        self._owns_file = isinstance(file_path, (str, os.PathLike))
+        self._file = open(file_path, "wb") if self._owns_file else file_path
+        self._layout = layout
+        page_size = landscape(letter) if layout.landscape else letter
+        self._pdf = PdfStreamWriter(self._file, page_size)
+        self._width, self._height = page_size
+        self._font = _pdf_font(self._pdf, font_name)
+        self._font_size = fp_str(layout.font_size).encode()
+        self._widths = glyph_widths(font_name, layout.font_size)
+
+        # Size of each logical page, and where the first line of each one starts
+        self._max_width = (self._width - 2 * layout.margin - (layout.columns - 1) * layout.gutter) / layout.columns
+        page_height = (self._height - 2 * layout.margin - (layout.rows - 1) * layout.gutter) / layout.rows
+        self._max_lines_per_page = int(page_height / layout.line_height)
+        self._page_origins = [
+            (layout.margin + column * (self._max_width + layout.gutter), self._height - layout.margin - row * (page_height + layout.gutter))
+            for row in range(layout.rows)
+            for column in range(layout.columns)
+        ]
+        self._pages: list[list[str]] = []  # Lines of each logical page of the current sheet
+        self._pending = ""
+
+    def _finish_sheet(self):
+        operators = []
+        for lines, origin in zip(self._pages, self._page_origins):
+            # One text object per logical page, starting at its top left with one line per row
+            operators.append(b"BT %s TL %s Td" % (fp_str(self._layout.line_height).encode(), fp_str(*origin).encode()))
+            resource = None
+            for line in lines:
+                for run_resource, run in self._font.encode(line):
+                    if run_resource != resource:
+                        resource = run_resource
+                        operators.append(b"/%s %s Tf" % (resource.encode(), self._font_size))
+                    operators.append(run + b" Tj")
+                operators.append(b"T*")
+            operators.append(b"ET")
+        self._pdf.add_page(b"\n".join(operators))
+        self._pages = []
+
+    def _draw(self, line):
+        if not self._pages or len(self._pages[-1]) >= self._max_lines_per_page:
+            if len(self._pages) == self._layout.pages_per_sheet:
+                self._finish_sheet()
+            self._pages.append([])
+        self._pages[-1].append(line)
+
+    def write_line(self, line):
+        for wrapped in wrap_paragraph(line, self._widths, self._max_width):
+            self._draw(wrapped)
+
+    def write_lines(self, lines: Iterable[str]):
+        for line in lines:
+            self.write_line(line)
+
+    def write(self, text):
+        """Writes a fragment of text; lines are laid out once they are complete."""
+        text = self._pending + text
+        start = 0
+        for line_break in _LINE_BREAK.finditer(text):
+            # A trailing "\r" may be half of a "\r\n" split across fragments
+            if line_break.group() == "\r" and line_break.end() == len(text):
+                break
+            self.write_line(text[start:line_break.start()])
+            start = line_break.end()
+        self._pending = text[start:]
+
+    def close(self):
+        for line in self._pending.splitlines():
+            self.write_line(line)
+        self._pending = ""
+        if self._pages:
+            self._finish_sheet()
+        self._font.close()
+        self._pdf.close()
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def create_pdf_with_text(text: str | Iterable[str], file_path, layout: PageLayout = LAYOUTS["1up"]):
+    """Create a multi-page PDF file with the specified text, given whole or as an iterable of fragments."""
+    with PdfTextWriter(file_path, layout=layout) as writer:
+        for fragment in [text] if isinstance(text, str) else text:
+            writer.write(fragment)
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from utils import gpt_utils, slack_helper
+from utils.configs import GPT_MAX_WORKERS
+from utils.configs import REPORT_WEEK_TOKEN_BUDGET
+from utils.message_compaction import compact_window
+from utils.message_window import MessageWindow
+from utils.summary_cache import bucket_digest, get_summary_cache
+
+WEEK_SECONDS = 7 * 24 * 3600
+# Monday 1970-01-05 00:00 UTC, so weekly buckets run from Monday to Sunday
+WEEK_ORIGIN = 4 * 24 * 3600
+
+
+def _summarize_bucket(scope: str, bucket_start: int, bucket: MessageWindow, cacheable: bool) -> str:
+    cache = get_summary_cache()
+    key = cache.key(scope, WEEK_SECONDS, bucket_start, gpt_utils.SUMMARY_PROMPT_VERSION, gpt_utils.router.cache_tag)
+    # Fingerprint what is actually summarized, so compaction changes also refresh the cache
+    bucket, _ = compact_window(bucket, REPORT_WEEK_TOKEN_BUDGET)
+    digest = bucket_digest(bucket)
+    if cacheable:
+        cached = cache.get(key)
+        if cached and cached[0] == digest:
+            return cached[1]
+
+    summary = gpt_utils.gpt_summarize_messages(slack_helper.message_texts(bucket.records()))
+    if cacheable:
+        cache.put(key, digest, summary)
+    return summary
+
+
+def summarize_weeks(window: MessageWindow, period_timestamp: int, scope: str = "workspace") -> list[str]:
+    """Summarizes a window of messages week by week, oldest week first.
+
+    Weeks run Monday to Sunday (UTC). Summaries of whole weeks are cached under
+    `scope`, so only weeks with new or changed messages are sent to the LLM; the
+    first week, which the period usually cuts in the middle, is summarized
+    without being cached. Each summary is prefixed with the date its week starts.
+    """
+    buckets = sorted(window.bucket_by_time(WEEK_ORIGIN, WEEK_SECONDS).items())
+    jobs = []
+    for number, bucket in buckets:
+        bucket_start = WEEK_ORIGIN + number * WEEK_SECONDS
+        jobs.append((scope, bucket_start, bucket, bucket_start >= period_timestamp))
+
+    with ThreadPoolExecutor(max_workers=max(1, GPT_MAX_WORKERS)) as executor:
+        summaries = list(executor.map(lambda job: _summarize_bucket(*job), jobs))
+
+    return [
+        f"Week of {datetime.fromtimestamp(bucket_start, timezone.utc).strftime('%Y-%m-%d')}:\n{summary}"
+        for (_, bucket_start, _, _), summary in zip(jobs, summaries)
+    ]
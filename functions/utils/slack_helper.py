@@ -1,135 +1,223 @@
-from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 import os
 from dotenv import load_dotenv
 import requests
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from model.document import MimeType
+from model.message import MessageRecord
+from utils.channel_catalog import ChannelCatalog
+from utils.configs import CHANNEL_CATALOG_TTL_SECONDS
+from utils.configs import FILE_INDEX_TTL_SECONDS
+from utils.configs import SLACK_FETCH_MAX_WORKERS
+from utils.configs import USER_DIRECTORY_TTL_SECONDS
+from utils.file_index import FileIndex
+from utils.message_store import get_message_store, to_message_record
+from utils.message_window import MessageWindow
+from utils.slack_scheduler import RateLimitedWebClient, scheduler
+from utils.user_directory import UserDirectory
 
 
 load_dotenv()
 
 slack_token = os.getenv("SLACK_BOT_TOKEN")
-client = WebClient(token=slack_token)
+client = RateLimitedWebClient(token=slack_token)
+channel_catalog = ChannelCatalog(client, CHANNEL_CATALOG_TTL_SECONDS)
+file_index = FileIndex(client, FILE_INDEX_TTL_SECONDS)
+user_directory = UserDirectory(client, USER_DIRECTORY_TTL_SECONDS)
+
+def _iter_channel_history(channel: dict, oldest: float) -> Iterator[list]:
+    """Yields a channel's history newer than `oldest` page by page, excluding 'channel_join' messages."""
+    response = client.conversations_history(
+        channel=channel["id"], oldest=oldest
+    )
+    while response["messages"]:
+        yield [
+            to_message_record(channel["id"], msg)
+            for msg in response["messages"] if msg.get("subtype") != "channel_join"
+        ]
+
+        if not response["has_more"]:
+            break
+
+        response = client.conversations_history(
+            channel=channel["id"],
+            oldest=oldest,
+            cursor=response["response_metadata"]["next_cursor"],
+        )
+
+def _sync_channel(channel: dict, period_timestamp: int) -> bool:
+    """Brings a channel's messages in the message store up to date for the specified period.
+
+    Only messages newer than the channel's high water mark are requested from
+    Slack, and each page is saved as soon as it arrives. Returns False if the
+    channel could not be joined or read.
+    """
+    channel_id = channel["id"]
+    store = get_message_store()
+    print(
+        f"Fetching messages for channel: {channel['name']} (ID: {channel_id})"
+    )
+
+    # Try to join the channel if not already a member
+    if not channel_catalog.ensure_joined(channel):
+        return False  # Skip this channel if join fails
+
+    # Resume from the high water mark if the store already covers the period
+    sync_state = store.get_sync_state(channel_id)
+    if sync_state and sync_state[0] <= period_timestamp:
+        synced_from, high_water_mark = sync_state
+    else:
+        synced_from, high_water_mark = period_timestamp, period_timestamp
 
-def fetch_messages_for_period(period_timestamp: int) -> str:
-    """Fetches messages from all Slack channels starting from a given timestamp."""
-    all_messages_text = ""
+    new_message_count = 0
+    newest_ts = high_water_mark
     try:
-        # Step 1: List all channels
-        channels = []
-        response = client.conversations_list()
-        while response["channels"]:
-            channels.extend(response["channels"])
-            if not response["has_more"]:
-                break
-            response = client.conversations_list(
-                cursor=response["response_metadata"]["next_cursor"]
-            )
-
-        # Step 2: For each channel, get messages from the specified period
-        for channel in channels:
-            channel_id = channel["id"]
-            channel_messages = []
-            print(
-                f"Fetching messages for channel: {channel['name']} (ID: {channel_id})"
-            )
-
-            # Try to join the channel if not already a member
-            try:
-                client.conversations_join(channel=channel_id)
-            except SlackApiError as join_error:
-                if join_error.response["error"] != "method_not_supported_for_channel_type":
-                    print(
-                        f"Could not join channel {channel['name']}: {join_error.response['error']}"
-                    )
-                    continue  # Skip this channel if join fails
-
-            # Fetch messages for the specified period
-            try:
-                response = client.conversations_history(
-                    channel=channel_id, oldest=period_timestamp
-                )
-
-                # Collect all messages from the response, excluding those with subtype 'channel_join'
-                while response["messages"]:
-                    filtered_messages = [
-                        msg for msg in response["messages"] if msg.get("subtype") != "channel_join"
-                    ]
-                    channel_messages.extend(filtered_messages)
-
-                    if not response["has_more"]:
-                        break
-
-                    response = client.conversations_history(
-                        channel=channel_id,
-                        oldest=period_timestamp,
-                        cursor=response["response_metadata"]["next_cursor"],
-                    )
-
-                if channel_messages:
-                    print(
-                        f"Found {len(channel_messages)} messages in channel: {channel['name']}"
-                    )
-                else:
-                    print(f"No messages found in channel: {channel['name']}")
+        for page in _iter_channel_history(channel, high_water_mark):
+            store.save_messages(channel_id, page)
+            new_message_count += len(page)
+            newest_ts = max([newest_ts] + [float(msg.ts) for msg in page])
+    except SlackApiError as e:
+        print(
+            f"Error fetching messages for channel {channel['name']}: {e.response['error']}"
+        )
+        if e.response["error"] == "not_in_channel":
+            # The bot was removed since membership was cached; join again on the next run
+            channel_catalog.forget_joined(channel_id)
+        return False
+
+    # Pages arrive newest first, so the high water mark only moves once all of them are saved.
+    # A fetch from the start of the period is recorded even if it found nothing, so it is not repeated.
+    if new_message_count or sync_state != (synced_from, newest_ts):
+        store.set_sync_state(channel_id, synced_from, newest_ts)
+    print(f"Fetched {new_message_count} new messages in channel: {channel['name']}")
+    return True
+
+def _sync_channels(period_timestamp: int, max_workers: int) -> list:
+    """Syncs every channel in parallel and returns the synced channels in channel-list order.
+
+    One sync serves every reader afterwards: messages of all channels and all
+    users are then read from the message store without calling Slack.
+    """
+    channels = channel_catalog.channels_active_since(period_timestamp)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        synced = list(executor.map(
+            lambda channel: _sync_channel(channel, period_timestamp), channels
+        ))
+    print(f"Slack API calls so far: {scheduler.stats()}")
+    return [channel for channel, ok in zip(channels, synced) if ok]
+
+def iter_messages_for_period(period_timestamp: int, max_workers: int = SLACK_FETCH_MAX_WORKERS) -> Iterator[MessageRecord]:
+    """Yields the messages of all Slack channels starting from a given timestamp.
+
+    Channels are synced concurrently by up to `max_workers` threads first. Messages
+    are then read from the message store page by page, channel by channel in
+    channel-list order and newest first within a channel. Callers collect them
+    into a MessageWindow, so the window is held in its columnar form rather
+    than as a list of message records.
+    """
+    store = get_message_store()
+    for channel in _sync_channels(period_timestamp, max_workers):
+        yield from store.iter_messages(channel["id"], period_timestamp)
+
+def iter_user_messages_for_period(user_id: str, period_timestamp: int, sync: bool = True, max_workers: int = SLACK_FETCH_MAX_WORKERS) -> Iterator[MessageRecord]:
+    """Yields a user's messages across all Slack channels starting from a given timestamp, newest first.
+
+    Pass `sync=False` when the channels were already synced for the period, e.g.
+    when reading several users after one sync.
+    """
+    if sync:
+        _sync_channels(period_timestamp, max_workers)
+    yield from get_message_store().iter_user_messages(user_id, period_timestamp)
+
+def fetch_message_window_for_period(period_timestamp: int, max_workers: int = SLACK_FETCH_MAX_WORKERS) -> MessageWindow:
+    """Fetches the messages of all Slack channels starting from a given timestamp into a columnar window."""
+    try:
+        return MessageWindow.from_records(iter_messages_for_period(period_timestamp, max_workers))
+    except SlackApiError as e:
+        print(f"Slack API error: {e.response['error']}")
+    return MessageWindow.from_records([])
 
-                # Append each message's text to `all_messages_text`
-                for message in channel_messages:
-                    all_messages_text += message.get("text", "") + "\n"
+def message_texts(messages: Iterable[MessageRecord]) -> list[str]:
+    """Returns the text of each message, with <@Uxxxx> mentions turned into names the report can refer to."""
+    return list(user_directory.resolve_mentions(message.text for message in messages))
 
-            except SlackApiError as e:
-                print(
-                    f"Error fetching messages for channel {channel['name']}: {e.response['error']}"
-                )
+def message_texts_by_channel(window: MessageWindow) -> list[str]:
+    """Returns the texts of a window's messages grouped by channel, each prefixed with its channel name.
 
+    Messages stay in time order within a channel. The label is on every message
+    so it survives when a long report is split into chunks.
+    """
+    try:
+        channel_names = {channel["id"]: channel["name"] for channel in channel_catalog.channels()}
     except SlackApiError as e:
-        print(f"Slack API error: {e.response['error']}")
-    
-    return all_messages_text
+        print(f"Could not fetch channel names: {e.response['error']}")
+        channel_names = {}
+    labels, records = [], []
+    for channel_id, channel_window in window.group_by_channel().items():
+        label = f"#{channel_names.get(channel_id, channel_id)}"
+        for record in channel_window.records():
+            labels.append(label)
+            records.append(record)
+    return [f"{label}: {text}" for label, text in zip(labels, message_texts(records))]
+
+def _indexed_file_result(entry: dict) -> dict:
+    """Formats a file index entry like the results of get_file_from_channels, without a channel name if the channels cannot be listed."""
+    try:
+        channel_names = {channel["id"]: channel["name"] for channel in channel_catalog.channels()}
+    except SlackApiError as e:
+        print(f"Could not fetch channel names: {e.response['error']}")
+        channel_names = {}
+    return {
+        "channel": next(
+            (channel_names[channel_id] for channel_id in entry["channel_ids"] if channel_id in channel_names),
+            None,
+        ),
+        "file_id": entry["file_id"],
+        "file_name": entry["file_name"],
+        "file_url": entry["file_url"],
+    }
 
 def get_file_from_channels(file_name_to_search: str, period_timestamp: int):
-    """Search for a file by name in all Slack channels from a given timestamp."""
+    """Search for a file by name in all Slack channels from a given timestamp.
+
+    The file index is consulted first. If it has no match, channel histories are
+    scanned newest first and the scan stops at the first matching file.
+    """
     found_files = []
     try:
-        # List all channels
-        channels = []
-        response = client.conversations_list()
-        while response["channels"]:
-            channels.extend(response["channels"])
-            if not response["has_more"]:
-                break
-            response = client.conversations_list(
-                cursor=response["response_metadata"]["next_cursor"]
-            )
+        indexed_files = file_index.lookup(file_name_to_search, period_timestamp)
+        if indexed_files:
+            return [_indexed_file_result(indexed_files[0])]
+    except SlackApiError as e:
+        print(f"Could not search the file index: {e.response['error']}")
 
-        # Search each channel for the file
+    try:
+        # Search each channel that can have messages in the period for the file
+        channels = channel_catalog.channels_active_since(period_timestamp)
         for channel in channels:
             channel_id = channel["id"]
-            try:
-                client.conversations_join(channel=channel_id)
-            except SlackApiError as join_error:
-                if join_error.response["error"] != "method_not_supported_for_channel_type":
-                    print(f"Could not join channel {channel['name']}: {join_error.response['error']}")
-                    continue
+            if not channel_catalog.ensure_joined(channel):
+                continue
 
-            # Fetch messages in the specified period
+            # Fetch messages in the specified period, newest first
             try:
                 response = client.conversations_history(
                     channel=channel_id, oldest=period_timestamp
                 )
 
-                # Loop through messages to find files with matching names
+                # Loop through messages until a file with a matching name is found
                 while response["messages"]:
                     for msg in response["messages"]:
-                        if "files" in msg:
-                            for file in msg["files"]:
-                                if file.get("name") == file_name_to_search:
-                                    found_files.append({
-                                        "channel": channel["name"],
-                                        "file_id": file["id"],
-                                        "file_name": file["name"],
-                                        "file_url": file["url_private"]
-                                    })
+                        for file in msg.get("files", []):
+                            if file.get("name") == file_name_to_search:
+                                found_files.append({
+                                    "channel": channel["name"],
+                                    "file_id": file["id"],
+                                    "file_name": file["name"],
+                                    "file_url": file["url_private"]
+                                })
+                                return found_files
 
                     if not response["has_more"]:
                         break
@@ -141,12 +229,39 @@ def get_file_from_channels(file_name_to_search: str, period_timestamp: int):
 
             except SlackApiError as e:
                 print(f"Error fetching messages for channel {channel['name']}: {e.response['error']}")
+                if e.response["error"] == "not_in_channel":
+                    channel_catalog.forget_joined(channel_id)
     except SlackApiError as e:
         print(f"Slack API error: {e.response['error']}")
     
     return found_files
 
 
+def search_files(query: str, period_timestamp: int, limit: int = 5) -> tuple[list, list]:
+    """Finds a file by a user-typed name, returning `(found_files, suggested_file_names)`.
+
+    Names are matched case-insensitively. When there is no exact match, the closest
+    file names from the file index are suggested instead of scanning every channel;
+    the history scan only runs when nothing in the index is even close.
+    """
+    try:
+        candidates = file_index.search(query, period_timestamp, limit)
+    except SlackApiError as e:
+        print(f"Could not search the file index: {e.response['error']}")
+        candidates = []
+
+    exact_matches = [
+        candidate for candidate in candidates if candidate["file_name"].lower() == query.lower()
+    ]
+    if exact_matches:
+        # Prefer the name typed with the exact same case
+        exact_matches.sort(key=lambda candidate: candidate["file_name"] != query)
+        return [_indexed_file_result(exact_matches[0])], []
+    if candidates:
+        return [], [candidate["file_name"] for candidate in candidates]
+    return get_file_from_channels(query, period_timestamp), []
+
+
 # Define a mapping dictionary for MIME types
 EXTENSION_TO_MIME = {
     ".pdf": "application/pdf",
@@ -176,86 +291,33 @@ def download_file(file_url: str, file_name: str):
         print(f"Failed to download file or unexpected content type: {response.status_code} - {response.headers.get('Content-Type')}")
         return None, "text/html"
     
-def fetch_user_messages_for_period(user_id: str, period_timestamp: int) -> str:
-    """Fetches messages from a specific user across all Slack channels starting from a given timestamp."""
-    user_messages_text = ""
+def fetch_messages_by_user_for_period(user_ids: list, period_timestamp: int, max_workers: int = SLACK_FETCH_MAX_WORKERS) -> dict:
+    """Fetches the messages of several users across all Slack channels starting from a given timestamp, one window per user.
+
+    Channels are synced once for all users; each user's messages are then read
+    from the message store's per-user index, so a batch of user reports costs one
+    pass over Slack rather than one per user.
+    """
+    user_messages = {user_id: MessageWindow.from_records([]) for user_id in user_ids}
     try:
-        # Step 1: List all channels
-        channels = []
-        response = client.conversations_list()
-        while response["channels"]:
-            channels.extend(response["channels"])
-            if not response["has_more"]:
-                break
-            response = client.conversations_list(
-                cursor=response["response_metadata"]["next_cursor"]
+        _sync_channels(period_timestamp, max_workers)
+        for user_id in user_ids:
+            user_messages[user_id] = MessageWindow.from_records(
+                iter_user_messages_for_period(user_id, period_timestamp, sync=False)
             )
 
-        # Step 2: For each channel, get messages from the specified period by the user
-        for channel in channels:
-            channel_id = channel["id"]
-            channel_messages = []
-            print(f"Fetching messages for user {user_id} in channel: {channel['name']} (ID: {channel_id})")
-
-            # Try to join the channel if not already a member
-            try:
-                client.conversations_join(channel=channel_id)
-            except SlackApiError as join_error:
-                if join_error.response["error"] != "method_not_supported_for_channel_type":
-                    print(f"Could not join channel {channel['name']}: {join_error.response['error']}")
-                    continue  # Skip this channel if join fails
-
-            # Fetch messages for the specified period
-            try:
-                response = client.conversations_history(
-                    channel=channel_id, oldest=period_timestamp
-                )
-
-                # Collect all messages from the user, excluding those with subtype 'channel_join'
-                while response["messages"]:
-                    user_filtered_messages = [
-                        msg for msg in response["messages"]
-                        if msg.get("user") == user_id and msg.get("subtype") != "channel_join"
-                    ]
-                    channel_messages.extend(user_filtered_messages)
-
-                    if not response["has_more"]:
-                        break
-
-                    response = client.conversations_history(
-                        channel=channel_id,
-                        oldest=period_timestamp,
-                        cursor=response["response_metadata"]["next_cursor"],
-                    )
-
-                if channel_messages:
-                    print(f"Found {len(channel_messages)} messages in channel: {channel['name']}")
-                else:
-                    print(f"No messages found for user {user_id} in channel: {channel['name']}")
-
-                # Append each message's text to `user_messages_text`
-                for message in channel_messages:
-                    user_messages_text += message.get("text", "") + "\n"
-
-            except SlackApiError as e:
-                print(f"Error fetching messages for channel {channel['name']}: {e.response['error']}")
-
     except SlackApiError as e:
         print(f"Slack API error: {e.response['error']}")
 
-    return user_messages_text
+    return user_messages
 
 
 def get_user_id_by_name(username: str) -> str:
     """Fetches the user ID of a Slack user by their name."""
     try:
-        # Get a list of all users
-        response = client.users_list()
-        if response["ok"]:
-            for user in response["members"]:
-                # Check both real_name and display_name
-                if user["real_name"] == username or user["profile"]["display_name"] == username:
-                    return user["id"]
+        user_id = user_directory.find_user_id(username)
+        if user_id:
+            return user_id
         print(f"User '{username}' not found.")
     except SlackApiError as e:
         print(f"Error fetching users: {e.response['error']}")
@@ -0,0 +1,126 @@
+import threading
+import time
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from utils.configs import SLACK_MAX_RATE_LIMIT_RETRIES
+from utils.configs import SLACK_TIER_REQUESTS_PER_MINUTE
+
+# Slack's rate limit tier of each Web API method the bot uses
+# (https://api.slack.com/docs/rate-limits). Unlisted methods are treated as Tier 3.
+METHOD_TIERS = {
+    "conversations.list": 2,
+    "conversations.join": 3,
+    "conversations.history": 3,
+    "conversations.info": 3,
+    "files.list": 3,
+    "users.list": 2,
+    "users.info": 4,
+}
+_DEFAULT_TIER = 3
+
+
+class TokenBucket:
+    """Hands out calls at a steady rate with bursts of up to `capacity` calls.
+
+    Calls are not paced until the bucket is first paused, so a method that Slack
+    never rate limits is never slowed down.
+    """
+
+    def __init__(self, requests_per_minute: float, capacity: float):
+        self.rate = requests_per_minute / 60
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._paced = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Blocks until a call may be made. Returns how long it waited, in seconds."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if now >= self._paused_until and (self._tokens >= 1 or not self._paced):
+                    self._tokens = max(0.0, self._tokens - 1)
+                    return waited
+                delay = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        """Stops handing out calls for `seconds`, e.g. after Slack answered with Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            self._paced = True
+
+
+class SlackCallScheduler:
+    """Paces Slack Web API calls with one token bucket per API method.
+
+    Slack counts its rate limits per method, so each method gets its own bucket.
+    Calls go out as fast as they are made until Slack answers with 429; the call
+    is then retried after the `Retry-After` delay, the method is paused for that
+    long so other threads back off too, and from then on the method is paced at
+    its tier's rate with bursts of up to a minute's worth of calls.
+    """
+
+    def __init__(self, tier_requests_per_minute: dict[int, float], max_retries: int):
+        self.max_retries = max_retries
+        self.tier_requests_per_minute = tier_requests_per_minute
+        self._buckets: dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        self._stats = {"calls": 0, "throttled_calls": 0, "retries": 0, "wait_seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _bucket(self, api_method: str) -> TokenBucket:
+        with self._buckets_lock:
+            bucket = self._buckets.get(api_method)
+            if bucket is None:
+                per_minute = self.tier_requests_per_minute[METHOD_TIERS.get(api_method, _DEFAULT_TIER)]
+                bucket = self._buckets[api_method] = TokenBucket(per_minute, capacity=max(1.0, per_minute))
+            return bucket
+
+    def _record(self, **increments) -> None:
+        with self._stats_lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def call(self, api_method: str, send):
+        """Runs `send()` once `api_method`'s bucket allows it, retrying when rate limited."""
+        bucket = self._bucket(api_method)
+        attempt = 0
+        while True:
+            waited = bucket.acquire()
+            self._record(calls=1, wait_seconds=waited, throttled_calls=int(waited > 0))
+            try:
+                return send()
+            except SlackApiError as e:
+                if e.response.status_code != 429 or attempt >= self.max_retries:
+                    raise
+                headers = {key.lower(): value for key, value in (e.response.headers or {}).items()}
+                retry_after = float(headers.get("retry-after", 1))
+                print(f"Rate limited on {api_method}, retrying in {retry_after}s")
+                bucket.pause(retry_after)
+                self._record(retries=1)
+                attempt += 1
+
+    def stats(self) -> dict:
+        """Returns how many calls were made, throttled and retried, and the total time spent waiting."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+scheduler = SlackCallScheduler(SLACK_TIER_REQUESTS_PER_MINUTE, SLACK_MAX_RATE_LIMIT_RETRIES)
+
+
+class RateLimitedWebClient(WebClient):
+    """WebClient whose every API call goes through the process-wide `scheduler`."""
+
+    def api_call(self, api_method: str, **kwargs):
+        return scheduler.call(api_method, lambda: super(RateLimitedWebClient, self).api_call(api_method, **kwargs))
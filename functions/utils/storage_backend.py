@@ -0,0 +1,42 @@
+import threading
+from collections.abc import Callable
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class FirestoreBackend:
+    """Base of the Firestore stores: a Firestore client and the collection the store keeps its documents in."""
+
+    def __init__(self, collection: str):
+        self._collection_name = collection
+        self._db = None
+
+    @property
+    def _client(self):
+        # The Firestore client is created lazily because firebase_admin is
+        # initialized in main.py after the function modules are imported.
+        if self._db is None:
+            from firebase_admin import firestore
+
+            self._db = firestore.client()
+        return self._db
+
+    @property
+    def _collection(self):
+        return self._client.collection(self._collection_name)
+
+
+class BackendSingleton(Generic[T]):
+    """The process-wide instance of a store, created on first use for the backend configured for it ("sqlite" or "firestore")."""
+
+    def __init__(self, backend: str, sqlite: Callable[[], T], firestore: Callable[[], T]):
+        self._factory = sqlite if backend == "sqlite" else firestore
+        self._instance: T | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        with self._lock:
+            if self._instance is None:
+                self._instance = self._factory()
+            return self._instance
@@ -0,0 +1,40 @@
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypeVar
+
+from utils.token_utils import pack_chunks
+
+T = TypeVar("T")
+
+
+def map_reduce_summarize(
+    units: list[str],
+    summarize: Callable[[str], str],
+    combine: Callable[[str], str],
+    finish: Callable[[str, bool], T],
+    budget_tokens: int,
+    max_workers: int,
+) -> T:
+    """Summarizes any amount of text with a tree of bounded-size LLM calls.
+
+    If all `units` fit in `budget_tokens`, `finish(text, False)` runs on them
+    directly. Otherwise the units are packed into chunks that are summarized in
+    parallel, the partial summaries are combined level by level (also in
+    parallel) until they fit in one budget, and `finish(summaries, True)` turns
+    them into the final text. The number of sequential LLM round trips grows with
+    the logarithm of the input size.
+    """
+    chunks = pack_chunks(units, budget_tokens)
+    if len(chunks) <= 1:
+        return finish(chunks[0] if chunks else "", False)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        partials = list(executor.map(summarize, chunks))
+        level = 1
+        while True:
+            groups = pack_chunks(partials, budget_tokens, min_units=2)
+            print(f"Summary level {level}: {len(partials)} partial summaries in {len(groups)} groups")
+            if len(groups) == 1:
+                return finish(groups[0], True)
+            partials = list(executor.map(combine, groups))
+            level += 1
@@ -0,0 +1,101 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from utils.configs import SUMMARY_CACHE_BACKEND
+from utils.configs import SUMMARY_CACHE_SQLITE_PATH
+from utils.message_window import MessageWindow
+from utils.storage_backend import BackendSingleton, FirestoreBackend
+
+
+def bucket_digest(window: MessageWindow) -> str:
+    """Fingerprints the messages of a time bucket, so a cached summary is only reused if they are unchanged."""
+    digest = hashlib.sha256()
+    # Messages with the same timestamp can come from any channel first, so order them by channel too
+    order = sorted(range(len(window)), key=lambda i: (window.ts[i], window.channels[window.channel_codes[i]]))
+    for i in order:
+        digest.update(f"{window.channels[window.channel_codes[i]]}\0{window.ts[i]:.6f}\0".encode())
+        digest.update(window.texts[i].encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SummaryCache(ABC):
+    """Persists LLM summaries of time buckets of Slack messages.
+
+    Entries are keyed by `(scope, bucket_seconds, bucket_start, prompt_version,
+    model)`, where the scope is a channel ID or "workspace", and store the digest
+    of the messages they summarize next to the summary. A changed prompt or model
+    therefore misses the cache, and a bucket that received new messages is
+    detected by comparing digests.
+    """
+
+    @staticmethod
+    def key(scope: str, bucket_seconds: int, bucket_start: int, prompt_version: int, model: str) -> str:
+        return f"{scope}_{bucket_seconds}_{bucket_start}_v{prompt_version}_{model}"
+
+    @abstractmethod
+    def get(self, key: str) -> tuple[str, str] | None:
+        """Returns the `(digest, summary)` stored under `key`, if any."""
+
+    @abstractmethod
+    def put(self, key: str, digest: str, summary: str) -> None:
+        ...
+
+
+class SQLiteSummaryCache(SummaryCache):
+    """Local stand-in for the Firestore cache, for local runs and the Functions emulator (SUMMARY_CACHE_BACKEND=sqlite)."""
+
+    def __init__(self, path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, digest TEXT, summary TEXT, updated_at REAL)"
+            )
+
+    def get(self, key: str) -> tuple[str, str] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest, summary FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, key: str, digest: str, summary: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                (key, digest, summary, time.time()),
+            )
+
+
+class FirestoreSummaryCache(FirestoreBackend, SummaryCache):
+    """Stores summaries under `summary_cache/{key}`."""
+
+    def __init__(self, collection: str = "summary_cache"):
+        super().__init__(collection)
+
+    def get(self, key: str) -> tuple[str, str] | None:
+        snapshot = self._collection.document(key).get()
+        if not snapshot.exists:
+            return None
+        data = snapshot.to_dict()
+        return data["digest"], data["summary"]
+
+    def put(self, key: str, digest: str, summary: str) -> None:
+        self._collection.document(key).set(
+            {"digest": digest, "summary": summary, "updated_at": time.time()}
+        )
+
+
+_cache = BackendSingleton(
+    SUMMARY_CACHE_BACKEND, lambda: SQLiteSummaryCache(SUMMARY_CACHE_SQLITE_PATH), FirestoreSummaryCache
+)
+
+
+def get_summary_cache() -> SummaryCache:
+    """Returns the process-wide summary cache selected by SUMMARY_CACHE_BACKEND."""
+    return _cache.get()
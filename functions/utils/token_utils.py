@@ -0,0 +1,103 @@
+from dataclasses import dataclass
+
+# Context window, in tokens, of the models the bot calls
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+_DEFAULT_CONTEXT_TOKENS = 8192
+
+# Tokens taken by the chat format around each message
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates how many tokens `text` takes, erring on the high side.
+
+    English averages about four characters or three quarters of a word per
+    token; characters outside ASCII (accents, Cyrillic, CJK) cost roughly one
+    extra token per two UTF-8 bytes. Only C-level string operations are used, so
+    a year of messages is measured in milliseconds.
+    """
+    if not text:
+        return 0
+    chars = len(text)
+    words = len(text.split())
+    extra_bytes = len(text.encode("utf-8")) - chars
+    return max(chars // 4, words * 4 // 3) + extra_bytes // 2 + 1
+
+
+def context_tokens(model: str) -> int:
+    return MODEL_CONTEXT_TOKENS.get(model, _DEFAULT_CONTEXT_TOKENS)
+
+
+def pack_chunks(units: list[str], budget_tokens: int, separator: str = "\n", min_units: int = 1) -> list[str]:
+    """Packs consecutive units (messages, paragraphs, summaries) into chunks of at most `budget_tokens`.
+
+    Units are joined with `separator` and never split unless a single unit is
+    larger than the budget. Each chunk holds at least `min_units` units, so
+    repeated packing always makes progress.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for unit in units:
+        unit_tokens = estimate_tokens(unit)
+        if unit_tokens > budget_tokens:
+            # Split an oversized unit into pieces that fit, on line or word boundaries where possible
+            pieces = _split_oversized(unit, budget_tokens)
+        else:
+            pieces = [unit]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > budget_tokens and len(current) >= min_units:
+                chunks.append(separator.join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def _split_oversized(unit: str, budget_tokens: int) -> list[str]:
+    pieces = []
+    while unit:
+        # Shrink the cut until the piece fits, then back off to the last line or word break
+        end = min(len(unit), budget_tokens * 4)
+        while end > 1 and estimate_tokens(unit[:end]) > budget_tokens:
+            end = end * 3 // 4
+        if end < len(unit):
+            for boundary in ("\n", " "):
+                cut = unit.rfind(boundary, 0, end)
+                if cut > end // 2:
+                    end = cut + 1
+                    break
+        pieces.append(unit[:end])
+        unit = unit[end:]
+    return pieces
+
+
+@dataclass
+class Preflight:
+    """Outcome of checking a prompt against a model's context window before sending it."""
+
+    input_tokens: int
+    max_tokens: int
+    fits: bool
+
+
+def preflight(model: str, prompt_parts: list[str], max_tokens: int, min_output_tokens: int = 256) -> Preflight:
+    """Checks whether a prompt fits `model`'s context window with room for the answer.
+
+    `max_tokens` is lowered to what is left of the context window after the
+    prompt; the prompt only fits if at least `min_output_tokens` remain.
+    """
+    input_tokens = sum(estimate_tokens(part) + _MESSAGE_OVERHEAD_TOKENS for part in prompt_parts)
+    available = context_tokens(model) - input_tokens
+    return Preflight(
+        input_tokens=input_tokens,
+        max_tokens=max(0, min(max_tokens, available)),
+        fits=available >= min(max_tokens, min_output_tokens),
+    )
@@ -0,0 +1,59 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from model.language import Language
+
+
+@dataclass(frozen=True)
+class CachedTranslation:
+    pdf_bytes: bytes
+    layout: str  # Name of the pdf_util page layout pdf_bytes is set in
+
+    @property
+    def size(self) -> int:
+        return len(self.pdf_bytes)
+
+
+class TranslationCache:
+    """In-memory LRU cache of finished translations, bounded by their total size in bytes.
+
+    Entries are content addressed: the key is derived from the SHA-256 of the
+    extracted text, the target language, the model and the prompt version, so
+    re-uploads of the same document hit the cache and prompt or model changes
+    miss it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, CachedTranslation] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str, language: Language, model: str, prompt_version: int) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+        return f"{text_hash}:{language.value}:{model}:v{prompt_version}"
+
+    def get(self, key: str) -> CachedTranslation | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, pdf_bytes: bytes, layout: str) -> None:
+        entry = CachedTranslation(pdf_bytes, layout)
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous.size
+            self._entries[key] = entry
+            self._size += entry.size
+            # Evict the least recently used translations until the budget is met
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
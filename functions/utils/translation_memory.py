@@ -0,0 +1,155 @@
+import hashlib
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from collections.abc import Iterator
+
+from model.language import Language
+from utils import gpt_utils
+from utils.configs import TRANSLATION_MEMORY_BACKEND
+from utils.configs import TRANSLATION_MEMORY_SQLITE_PATH
+from utils.extract_file_text import TEXT_SECTION_SEPARATOR
+from utils.storage_backend import BackendSingleton, FirestoreBackend
+
+# Firestore's get_all and SQLite's IN lists are read in slices of this many keys
+_LOOKUP_BATCH_SIZE = 100
+
+# New translations are saved in groups of this many sections as they arrive
+_SAVE_BATCH_SIZE = 20
+
+# Firestore caps a write batch at 500 operations
+_FIRESTORE_BATCH_SIZE = 500
+
+
+def segment_key(segment: str, language: Language) -> str:
+    segment_hash = hashlib.sha256(segment.encode("utf-8", "surrogatepass")).hexdigest()
+    return f"{segment_hash}_{language.value}_{gpt_utils.router.cache_tag}_v{gpt_utils.TRANSLATE_PROMPT_VERSION}"
+
+
+class TranslationMemory(ABC):
+    """Remembers the translation of every document segment by the segment's hash and target language."""
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        """Returns the stored translations of those `keys` that are known."""
+
+    @abstractmethod
+    def put_many(self, translations: dict[str, str]) -> None:
+        ...
+
+
+class SQLiteTranslationMemory(TranslationMemory):
+    """Local stand-in for the Firestore translation memory, for local runs and the Functions emulator (TRANSLATION_MEMORY_BACKEND=sqlite)."""
+
+    def __init__(self, path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS segments (key TEXT PRIMARY KEY, translation TEXT)"
+            )
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + _LOOKUP_BATCH_SIZE]
+                found.update(self._conn.execute(
+                    f"SELECT key, translation FROM segments WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall())
+        return found
+
+    def put_many(self, translations: dict[str, str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO segments VALUES (?, ?)", list(translations.items())
+            )
+
+
+class FirestoreTranslationMemory(FirestoreBackend, TranslationMemory):
+    """Stores segment translations under `translation_memory/{key}`."""
+
+    def __init__(self, collection: str = "translation_memory"):
+        super().__init__(collection)
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        collection = self._collection
+        found = {}
+        for start in range(0, len(keys), _LOOKUP_BATCH_SIZE):
+            refs = [collection.document(key) for key in keys[start:start + _LOOKUP_BATCH_SIZE]]
+            for snapshot in self._client.get_all(refs):
+                if snapshot.exists:
+                    found[snapshot.id] = snapshot.to_dict()["translation"]
+        return found
+
+    def put_many(self, translations: dict[str, str]) -> None:
+        collection = self._collection
+        items = list(translations.items())
+        for start in range(0, len(items), _FIRESTORE_BATCH_SIZE):
+            batch = self._client.batch()
+            for key, translation in items[start:start + _FIRESTORE_BATCH_SIZE]:
+                batch.set(collection.document(key), {"translation": translation})
+            batch.commit()
+
+
+_memory = BackendSingleton(
+    TRANSLATION_MEMORY_BACKEND, lambda: SQLiteTranslationMemory(TRANSLATION_MEMORY_SQLITE_PATH), FirestoreTranslationMemory
+)
+
+
+def get_translation_memory() -> TranslationMemory:
+    """Returns the process-wide translation memory selected by TRANSLATION_MEMORY_BACKEND."""
+    return _memory.get()
+
+
+def iter_translate_with_memory(text: str, language: Language) -> Iterator[str]:
+    """Translates a document, sending only the sections that were never translated before to the LLM.
+
+    The text is split into the sections `extract_file_text` joined with
+    TEXT_SECTION_SEPARATOR. Known sections are taken from the translation
+    memory and the remaining ones are translated in concurrent batches. The
+    translated document is yielded in order, in fragments, as soon as each
+    section is available. New translations are remembered in groups as they
+    arrive, and a new translation is only held until its last use in the
+    document, so a long document's translation is never in memory at once.
+    """
+    segments = text.split(TEXT_SECTION_SEPARATOR)
+    keys = [segment_key(segment, language) for segment in segments]
+
+    memory = get_translation_memory()
+    known = memory.get_many(list(set(keys)))
+
+    # Translate each new segment once, even if it occurs several times
+    missing = {}
+    uses_left = Counter()
+    for key, segment in zip(keys, segments):
+        if key not in known and segment.strip():
+            missing.setdefault(key, segment)
+            uses_left[key] += 1
+    print(f"Translation memory: translating {len(missing)} new segments of {len(segments)}")
+
+    translated, unsaved = {}, {}
+    new_translations = zip(missing, gpt_utils.iter_translated_segments(list(missing.values()), language))
+    try:
+        for index, (key, segment) in enumerate(zip(keys, segments)):
+            if key in missing:
+                # Wait for the translations up to this section; they arrive in document order
+                while key not in translated:
+                    new_key, translation = next(new_translations)
+                    translated[new_key] = unsaved[new_key] = translation
+                    if len(unsaved) >= _SAVE_BATCH_SIZE:
+                        memory.put_many(unsaved)
+                        unsaved = {}
+                section = translated[key]
+                uses_left[key] -= 1
+                if not uses_left[key]:
+                    del translated[key]
+            else:
+                section = known.get(key, segment)
+            yield (TEXT_SECTION_SEPARATOR if index else "") + section
+    finally:
+        # Keep what was translated even if the consumer failed partway
+        if unsaved:
+            memory.put_many(unsaved)
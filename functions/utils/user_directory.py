@@ -0,0 +1,108 @@
+import re
+import threading
+import time
+from collections.abc import Iterable, Iterator
+
+from slack_sdk import WebClient
+
+# Page size recommended by Slack for users.list
+_USERS_LIST_PAGE_SIZE = 200
+
+# A name that is not in the directory only triggers a refresh this often, in seconds
+_MISS_REFRESH_INTERVAL = 60
+
+_MENTION_PATTERN = re.compile(r"<@([UW][A-Z0-9]+)(?:\|[^>]*)?>")
+
+
+def normalize_name(name: str) -> str:
+    """Normalizes a user-typed name for lookup: case-insensitive, no leading '@', single spaces."""
+    return " ".join(name.lstrip("@").split()).casefold()
+
+
+class UserDirectory:
+    """Caches the workspace's users with hash indexes on id, real name and display name.
+
+    The full user list is paged through `users.list` once and reused for
+    `ttl_seconds`, so on a warm instance name lookups cost no Slack call.
+    """
+
+    def __init__(self, client: WebClient, ttl_seconds: float):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self._by_id: dict[str, dict] = {}
+        self._by_real_name: dict[str, str] = {}
+        self._by_display_name: dict[str, str] = {}
+        self._refreshed_at: float | None = None
+        self._lock = threading.Lock()
+
+    def _refresh(self, force: bool = False) -> None:
+        with self._lock:
+            if self._refreshed_at is not None:
+                age = time.time() - self._refreshed_at
+                if age <= self.ttl_seconds and not (force and age > _MISS_REFRESH_INTERVAL):
+                    return
+
+            by_id, by_real_name, by_display_name = {}, {}, {}
+            response = self.client.users_list(limit=_USERS_LIST_PAGE_SIZE)
+            while True:
+                for user in response["members"]:
+                    by_id[user["id"]] = user
+                    real_name = normalize_name(user.get("real_name") or "")
+                    display_name = normalize_name(user.get("profile", {}).get("display_name") or "")
+                    # Keep the first user for a name, like the previous linear scan did
+                    if real_name:
+                        by_real_name.setdefault(real_name, user["id"])
+                    if display_name:
+                        by_display_name.setdefault(display_name, user["id"])
+
+                next_cursor = response.get("response_metadata", {}).get("next_cursor")
+                if not next_cursor:
+                    break
+                response = self.client.users_list(limit=_USERS_LIST_PAGE_SIZE, cursor=next_cursor)
+
+            self._by_id, self._by_real_name, self._by_display_name = by_id, by_real_name, by_display_name
+            self._refreshed_at = time.time()
+
+    def find_user_id(self, name: str) -> str | None:
+        """Returns the id of the user with the given real name, display name or id."""
+        self._refresh()
+        user_id = self._lookup(name)
+        if user_id is None:
+            # The user may have joined after the directory was cached
+            self._refresh(force=True)
+            user_id = self._lookup(name)
+        return user_id
+
+    def _lookup(self, name: str) -> str | None:
+        if name in self._by_id:
+            return name
+        normalized = normalize_name(name)
+        return self._by_real_name.get(normalized) or self._by_display_name.get(normalized)
+
+    def get_display_name(self, user_id: str) -> str:
+        """Returns the name shown for a user in Slack, or the id if the user is unknown."""
+        self._refresh()
+        return self._display_name(user_id)
+
+    def _display_name(self, user_id: str) -> str:
+        user = self._by_id.get(user_id)
+        if user is None:
+            return user_id
+        return user.get("profile", {}).get("display_name") or user.get("real_name") or user.get("name") or user_id
+
+    def resolve_mentions(self, texts: Iterable[str]) -> Iterator[str]:
+        """Yields each text with every `<@Uxxxx>` mention replaced by `@name`.
+
+        The directory is refreshed once for the whole batch. If it cannot be
+        loaded, the texts are yielded with their mentions left as they are.
+        """
+        try:
+            self._refresh()
+        except Exception as e:
+            print(f"Could not resolve user mentions: {e}")
+            yield from texts
+            return
+        def replace(match: re.Match) -> str:
+            return f"@{self._display_name(match.group(1))}"
+        for text in texts:
+            yield _MENTION_PATTERN.sub(replace, text)